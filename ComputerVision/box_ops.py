@@ -0,0 +1,15 @@
+import numpy as np
+
+'''Box geometry shared by the inference scripts (video.py tracking, benchmark_export.py agreement) and the box evaluation
+(evaluation_seg/box_eval.py). Boxes are (N, 4) xyxy arrays in pixels.'''
+
+def box_iou(a, b):
+    """
+    Pairwise IoU of two sets of xyxy boxes, (N, M).
+    """
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
@@ -1,7 +1,15 @@
+import os
+import sys
+
 from ultralytics import YOLO
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "inference"))
+from calibration import ensure_calibration, export_int8_tflite
+
 model = YOLO("yolo11n-egg_noeggseg.pt")
 
 
 model.export(format="tflite") 
 
+# full-integer export calibrated on lobster images (inference/calibration.py)
+export_int8_tflite(model, ensure_calibration(os.path.join("..", "..", "data.yaml")))
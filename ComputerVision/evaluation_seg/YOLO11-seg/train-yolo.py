@@ -1,6 +1,10 @@
 import os
+import sys
 from ultralytics import YOLO
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from shard_cache import build_shard_cache, install_shard_loader
+
 # Path to your last checkpoint
 path = 'yolov11seg_runs/experiment1/weights/last.pt'
 
@@ -9,6 +13,9 @@ if os.path.exists(path):
         model = YOLO(path)
         print("✅ Model loaded successfully.")
 
+        # decode the dataset once into the shard cache instead of every epoch
+        install_shard_loader(build_shard_cache('data.yaml', imgsz=640))
+
         # Train for 20 more epochs
         model.train(
             data='data.yaml',
@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import yaml
+
+DATA_YAML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data.yaml")
+
+# per-image IoU/Dice are kept as fixed-bin histograms (for the plots) instead of lists of floats
+HIST_BINS = 20
+
+def load_class_names(data_yaml=DATA_YAML):
+    """
+    Class names from a YOLO data.yaml, as a list ordered by class id.
+    """
+    with open(data_yaml, 'r') as f:
+        names = yaml.safe_load(f)["names"]
+    if isinstance(names, dict):
+        names = [names[k] for k in sorted(names)]
+    return list(names)
+
+def iou_dice(tp, fp, fn):
+    """
+    IoU and Dice per class from pixel counts. A class missing from both ground truth and prediction scores 1.0, as in compute_iou_dice.
+    """
+    tp, fp, fn = (np.asarray(x, dtype=np.float64) for x in (tp, fp, fn))
+    union = tp + fp + fn
+    empty = union == 0
+    iou = np.where(empty, 1.0, tp / np.maximum(union, 1))
+    dice = np.where(empty, 1.0, 2 * tp / np.maximum(2 * tp + fp + fn, 1))
+    return iou, dice
+
+class SegmentationAccumulator:
+    """
+    Running per-class TP/FP/FN pixel counts for segmentation evaluation. Memory depends only on the number of classes,
+    so millions of frames can be evaluated, and partial accumulators from workers or shards can be merged.
+    Micro scores pool the pixels of all images (and classes), macro scores average over classes; the per-image means
+    are kept as well since that is what evaluate_masks has always reported.
+    """
+
+    def __init__(self, class_names, bins=HIST_BINS):
+        self.class_names = list(class_names)
+        n = len(self.class_names)
+        self.images = 0
+        self.tp = np.zeros(n, dtype=np.int64)
+        self.fp = np.zeros(n, dtype=np.int64)
+        self.fn = np.zeros(n, dtype=np.int64)
+        self.image_iou_sum = np.zeros(n, dtype=np.float64)
+        self.image_dice_sum = np.zeros(n, dtype=np.float64)
+        self.iou_hist = np.zeros((n, bins), dtype=np.int64)
+        self.dice_hist = np.zeros((n, bins), dtype=np.int64)
+
+    def update(self, tp, fp, fn):
+        """
+        Add the pixel counts of one image, one value per class.
+        """
+        tp, fp, fn = (np.asarray(x, dtype=np.int64) for x in (tp, fp, fn))
+        self.tp += tp
+        self.fp += fp
+        self.fn += fn
+
+        iou, dice = iou_dice(tp, fp, fn)
+        self.image_iou_sum += iou
+        self.image_dice_sum += dice
+
+        rows = np.arange(len(self.class_names))
+        bins = self.iou_hist.shape[1]
+        self.iou_hist[rows, np.minimum((iou * bins).astype(int), bins - 1)] += 1
+        self.dice_hist[rows, np.minimum((dice * bins).astype(int), bins - 1)] += 1
+        self.images += 1
+
+    def update_confusion(self, cm):
+        """
+        Add one image from a pixel confusion matrix (rows - ground truth, columns - prediction) with background at index 0.
+        """
+        tp = np.diag(cm)[1:]
+        self.update(tp, cm.sum(axis=0)[1:] - tp, cm.sum(axis=1)[1:] - tp)
+
+    def merge(self, other):
+        """
+        Add the counts of another accumulator (another worker or shard) over the same classes.
+        """
+        if other.class_names != self.class_names:
+            raise ValueError(f"Cannot merge accumulators over different classes: {self.class_names} vs {other.class_names}")
+
+        self.images += other.images
+        for name in ("tp", "fp", "fn", "image_iou_sum", "image_dice_sum", "iou_hist", "dice_hist"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def save(self, path):
+        """
+        Save the counts to an .npz file so shards evaluated on other machines can be merged later.
+        """
+        np.savez(path, class_names=np.array(self.class_names), images=self.images, tp=self.tp, fp=self.fp, fn=self.fn,
+                 image_iou_sum=self.image_iou_sum, image_dice_sum=self.image_dice_sum,
+                 iou_hist=self.iou_hist, dice_hist=self.dice_hist)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        acc = cls(data["class_names"].tolist(), bins=data["iou_hist"].shape[1])
+        acc.images = int(data["images"])
+        for name in ("tp", "fp", "fn", "image_iou_sum", "image_dice_sum", "iou_hist", "dice_hist"):
+            setattr(acc, name, data[name])
+        return acc
+
+    def results(self):
+        """
+        Micro and macro IoU/Dice, plus the per-class scores and pixel counts.
+        """
+        iou, dice = iou_dice(self.tp, self.fp, self.fn)
+        micro_iou, micro_dice = iou_dice(self.tp.sum(), self.fp.sum(), self.fn.sum())
+        images = max(self.images, 1)
+
+        classes = {}
+        for c, name in enumerate(self.class_names):
+            classes[name] = {
+                "iou": float(iou[c]),
+                "dice": float(dice[c]),
+                "mean_image_iou": float(self.image_iou_sum[c] / images),
+                "mean_image_dice": float(self.image_dice_sum[c] / images),
+                "tp": int(self.tp[c]),
+                "fp": int(self.fp[c]),
+                "fn": int(self.fn[c]),
+            }
+
+        return {
+            "images": self.images,
+            "micro_iou": float(micro_iou),
+            "micro_dice": float(micro_dice),
+            "macro_iou": float(np.mean(iou)),
+            "macro_dice": float(np.mean(dice)),
+            "classes": classes,
+        }
+
+    def print_results(self):
+        results = self.results()
+        print(f"\nEvaluated {results['images']} images")
+        for name, scores in results["classes"].items():
+            print(f"{name} - IoU: {scores['iou']:.4f}, Dice: {scores['dice']:.4f} | "
+                  f"Mean image IoU: {scores['mean_image_iou']:.4f}, Mean image Dice: {scores['mean_image_dice']:.4f}")
+        print(f"Micro IoU: {results['micro_iou']:.4f}, Micro Dice: {results['micro_dice']:.4f}")
+        print(f"Macro IoU: {results['macro_iou']:.4f}, Macro Dice: {results['macro_dice']:.4f}")
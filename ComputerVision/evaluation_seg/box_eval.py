@@ -0,0 +1,275 @@
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+from accumulator import load_class_names, DATA_YAML
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "inference"))
+from box_ops import box_iou
+from prediction_cache import load_predictions
+
+'''Standalone detection evaluator: per-class AP50 and AP50-95 of cached predictions (inference/prediction_cache.py) against
+YOLO labels, without an Ultralytics validation run, so yolo11n and yolo12n can be compared on new field data. Labels can
+be detection boxes (class cx cy w h) or YOLO-seg polygons, whose extent is the box. Predictions are matched the COCO/Ultralytics way: in descending score order, every
+prediction takes the unmatched ground truth box of its class with the highest IoU, if that IoU reaches the threshold.
+Because a prediction is only ever affected by the higher-scored ones, its match at the confidence floor stays valid for
+any higher confidence threshold, which is what lets threshold_sweep.py re-threshold without matching again.
+
+The IoU matrix of every image is one array operation; images are matched in chunks across a process pool, and shard=(index,
+count) with save_path lets several machines split a dataset and merge the saved accumulators (merge_shards).'''
+
+# the ten IoU thresholds of AP50-95
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+def read_label_boxes(label_path, height, width):
+    """
+    Pixel xyxy boxes and class ids of a YOLO label file, detection (5 values) or segmentation (polygon) lines.
+    A missing label file is an image without objects; malformed lines are reported and skipped.
+    """
+    boxes, classes, bad = [], [], []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    values = np.array(line.split(), dtype=np.float32)
+                except ValueError:
+                    bad.append(number)
+                    continue
+                if len(values) == 5:
+                    cx, cy, w, h = values[1:]
+                    boxes.append([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+                elif len(values) >= 7:
+                    points = values[1:1 + 2 * ((len(values) - 1) // 2)].reshape(-1, 2)
+                    boxes.append(np.concatenate([points.min(axis=0), points.max(axis=0)]))
+                else:
+                    continue
+                classes.append(int(values[0]))
+    if bad:
+        print(f"Warning: {label_path} has malformed lines {bad}, skipped")
+
+    if not boxes:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int32)
+    return (np.array(boxes, dtype=np.float32) * np.array([width, height, width, height], dtype=np.float32),
+            np.array(classes, dtype=np.int32))
+
+def match_image(pred_boxes, pred_scores, pred_classes, gt_boxes, gt_classes, iou_thresholds=IOU_THRESHOLDS):
+    """
+    True positive flags (N, T) of the predictions of one image at every IoU threshold.
+    """
+    tp = np.zeros((len(pred_boxes), len(iou_thresholds)), dtype=bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return tp
+
+    iou = box_iou(pred_boxes, gt_boxes) * (pred_classes[:, None] == gt_classes[None, :])
+    taken = np.zeros((len(iou_thresholds), len(gt_boxes)), dtype=bool)
+    thresholds = np.asarray(iou_thresholds)[:, None]
+
+    # predictions that overlap nothing above the lowest threshold can never match, only the rest go through the loop
+    candidates = np.flatnonzero(iou.max(axis=1) >= thresholds.min())
+    for i in candidates[np.argsort(-pred_scores[candidates], kind="stable")]:
+        # every IoU threshold at once: best still unmatched ground truth box per threshold
+        free = np.where(taken, -1.0, iou[i][None, :])
+        best = free.argmax(axis=1)
+        hit = free[np.arange(len(best)), best] >= thresholds[:, 0]
+        tp[i, hit] = True
+        taken[np.flatnonzero(hit), best[hit]] = True
+    return tp
+
+def average_precision(tp, num_gt):
+    """
+    COCO 101-point interpolated AP of predictions already sorted by descending score (tp is (N,) or (N, T)).
+    NaN for a class without ground truth.
+    """
+    if num_gt == 0:
+        return np.nan if tp.ndim == 1 else np.full(tp.shape[1], np.nan)
+    if len(tp) == 0:
+        return 0.0 if tp.ndim == 1 else np.zeros(tp.shape[1])
+
+    single = tp.ndim == 1
+    tp = tp.reshape(len(tp), -1)
+    tpc = np.cumsum(tp, axis=0)
+    recall = tpc / num_gt
+    precision = tpc / np.arange(1, len(tp) + 1)[:, None]
+
+    points = np.linspace(0, 1, 101)
+    aps = []
+    for t in range(tp.shape[1]):
+        # precision envelope, then the best precision at recall >= each of the 101 points
+        envelope = np.maximum.accumulate(precision[::-1, t])[::-1]
+        idx = np.searchsorted(recall[:, t], points, side="left")
+        aps.append(np.where(idx < len(envelope), envelope[np.minimum(idx, len(envelope) - 1)], 0.0).mean())
+    return float(aps[0]) if single else np.array(aps)
+
+def match_chunk(chunk, iou_thresholds=IOU_THRESHOLDS):
+    """
+    Match the predictions of a chunk of images (label path, height, width, boxes, scores, classes). Runs in the worker
+    processes and returns the true positive flags and the ground truth classes of the chunk.
+    """
+    tps, gt_classes = [], []
+    for label_path, height, width, boxes, scores, classes in chunk:
+        gt_boxes, gt_cls = read_label_boxes(label_path, height, width)
+        tps.append(match_image(boxes, scores, classes, gt_boxes, gt_cls, iou_thresholds))
+        gt_classes.append(gt_cls)
+    return (np.concatenate(tps) if tps else np.zeros((0, len(iou_thresholds)), dtype=bool),
+            np.concatenate(gt_classes) if gt_classes else np.zeros(0, dtype=np.int32))
+
+def match_predictions(predictions, label_folder, iou_thresholds=IOU_THRESHOLDS, workers=None, shard=None, chunk_size=64):
+    """
+    Match a prediction cache against a label folder. Returns the indices of the predictions that were evaluated (all of
+    them unless sharded), their true positive flags (N, T) and the classes of the ground truth boxes.
+    """
+    offsets = predictions["offsets"]
+    images = list(range(len(predictions["names"])))
+    if shard:
+        index, count = shard
+        images = images[index::count]
+
+    jobs = []
+    for j in images:
+        s = slice(offsets[j], offsets[j + 1])
+        label_path = os.path.join(label_folder, os.path.splitext(str(predictions["names"][j]))[0] + ".txt")
+        jobs.append((label_path, int(predictions["heights"][j]), int(predictions["widths"][j]),
+                     predictions["boxes"][s], predictions["scores"][s], predictions["classes"][s]))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    try:
+        args = [iou_thresholds] * len(chunks)
+        matched = pool.map(match_chunk, chunks, args) if pool else map(match_chunk, chunks, args)
+        results = list(tqdm(matched, total=len(chunks), desc="Matching predictions"))
+    finally:
+        if pool:
+            pool.shutdown()
+
+    indices = np.concatenate([np.arange(offsets[j], offsets[j + 1]) for j in images]) if images else np.zeros(0, dtype=np.int64)
+    tp = np.concatenate([r[0] for r in results]) if results else np.zeros((0, len(iou_thresholds)), dtype=bool)
+    gt_classes = np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=np.int32)
+    return indices.astype(np.int64), tp, gt_classes
+
+class DetectionAccumulator:
+    """
+    Scores, classes and true positive flags of all evaluated predictions plus the ground truth classes. AP needs the whole
+    ranking, so unlike the pixel counts of SegmentationAccumulator the predictions themselves are kept; shards merge by
+    concatenation.
+    """
+
+    def __init__(self, class_names, iou_thresholds=IOU_THRESHOLDS):
+        self.class_names = list(class_names)
+        self.iou_thresholds = np.asarray(iou_thresholds)
+        self.scores = np.zeros(0, dtype=np.float32)
+        self.classes = np.zeros(0, dtype=np.int32)
+        self.tp = np.zeros((0, len(self.iou_thresholds)), dtype=bool)
+        self.gt_classes = np.zeros(0, dtype=np.int32)
+        self.images = 0
+
+    def update(self, scores, classes, tp, gt_classes, images=0):
+        self.scores = np.concatenate([self.scores, scores])
+        self.classes = np.concatenate([self.classes, classes])
+        self.tp = np.concatenate([self.tp, tp])
+        self.gt_classes = np.concatenate([self.gt_classes, gt_classes])
+        self.images += images
+
+    def merge(self, other):
+        self.update(other.scores, other.classes, other.tp, other.gt_classes, other.images)
+
+    def save(self, path):
+        np.savez(path, class_names=np.array(self.class_names), iou_thresholds=self.iou_thresholds, scores=self.scores,
+                 classes=self.classes, tp=self.tp, gt_classes=self.gt_classes, images=self.images)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            accumulator = cls([str(n) for n in data["class_names"]], data["iou_thresholds"])
+            accumulator.update(data["scores"], data["classes"], data["tp"], data["gt_classes"], int(data["images"]))
+        return accumulator
+
+    def results(self):
+        """
+        Per class AP50, AP50-95 and the precision/recall at the confidence with the best F1 (IoU 0.5), plus the means.
+        """
+        classes = {}
+        for c, name in enumerate(self.class_names):
+            num_gt = int(np.count_nonzero(self.gt_classes == c))
+            of_class = self.classes == c
+            order = np.argsort(-self.scores[of_class], kind="stable")
+            tp, scores = self.tp[of_class][order], self.scores[of_class][order]
+            aps = average_precision(tp, num_gt)
+
+            precision = recall = best_conf = np.nan
+            if num_gt and len(tp):
+                tpc = np.cumsum(tp[:, 0])
+                p, r = tpc / np.arange(1, len(tp) + 1), tpc / num_gt
+                best = int(np.argmax(2 * p * r / np.maximum(p + r, 1e-9)))
+                precision, recall, best_conf = float(p[best]), float(r[best]), float(scores[best])
+
+            classes[name] = {"ap50": float(aps[0]), "ap50_95": float(np.mean(aps)), "precision": precision,
+                             "recall": recall, "conf": best_conf, "instances": num_gt, "predictions": int(len(tp))}
+
+        return {
+            "images": self.images,
+            "map50": float(np.nanmean([c["ap50"] for c in classes.values()])) if classes else np.nan,
+            "map50_95": float(np.nanmean([c["ap50_95"] for c in classes.values()])) if classes else np.nan,
+            "classes": classes,
+        }
+
+    def print_results(self):
+        results = self.results()
+        print(f"\nEvaluated {results['images']} images")
+        print(f"{'class':<24}{'instances':>10}{'P':>8}{'R':>8}{'conf':>8}{'AP50':>8}{'AP50-95':>9}")
+        for name, c in results["classes"].items():
+            print(f"{name:<24}{c['instances']:>10}{c['precision']:>8.3f}{c['recall']:>8.3f}{c['conf']:>8.3f}"
+                  f"{c['ap50']:>8.3f}{c['ap50_95']:>9.3f}")
+        print(f"mAP50: {results['map50']:.4f}, mAP50-95: {results['map50_95']:.4f}")
+
+def evaluate_boxes(cache_path, label_folder, data_yaml=DATA_YAML, workers=None, shard=None, save_path=None):
+    """
+    AP50 / AP50-95 per class of a prediction cache against a label folder. shard=(index, count) only evaluates every
+    count-th image, and save_path stores the accumulator so shards run on different machines can be merged.
+    """
+    predictions = load_predictions(cache_path)
+    indices, tp, gt_classes = match_predictions(predictions, label_folder, workers=workers, shard=shard)
+
+    accumulator = DetectionAccumulator(load_class_names(data_yaml))
+    images = len(predictions["names"]) if not shard else len(range(shard[0], len(predictions["names"]), shard[1]))
+    accumulator.update(predictions["scores"][indices], predictions["classes"][indices], tp, gt_classes, images)
+
+    if save_path:
+        accumulator.save(save_path)
+    accumulator.print_results()
+    return accumulator
+
+def merge_shards(shard_paths):
+    """
+    Merge the accumulators saved by sharded evaluate_boxes runs.
+    """
+    accumulator = DetectionAccumulator.load(shard_paths[0])
+    for path in shard_paths[1:]:
+        accumulator.merge(DetectionAccumulator.load(path))
+    return accumulator
+
+def compare_models(cache_paths, label_folder, data_yaml=DATA_YAML, workers=None):
+    """
+    Evaluate several prediction caches (name -> path) on the same labels and print their AP side by side.
+    """
+    results = {name: evaluate_boxes(path, label_folder, data_yaml, workers).results() for name, path in cache_paths.items()}
+    class_names = load_class_names(data_yaml)
+
+    print(f"\n{'class':<24}" + "".join(f"{name + ' AP50':>18}{name + ' AP50-95':>20}" for name in results))
+    for class_name in class_names:
+        print(f"{class_name:<24}" + "".join(f"{r['classes'][class_name]['ap50']:>18.3f}{r['classes'][class_name]['ap50_95']:>20.3f}"
+                                            for r in results.values()))
+    print(f"{'all':<24}" + "".join(f"{r['map50']:>18.3f}{r['map50_95']:>20.3f}" for r in results.values()))
+    return results
+
+if __name__ == "__main__":
+    label_path = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\lobster_data_split\labels\test"
+    inference_dir = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\inference"
+
+    # caches written by inference/prediction_cache.py for each model on the same images
+    compare_models({
+        "yolo11n": os.path.join(inference_dir, "predictions_yolo11n_test.npz"),
+        "yolo12n": os.path.join(inference_dir, "predictions_yolo12n_test.npz"),
+    }, label_path, workers=os.cpu_count())
@@ -0,0 +1,134 @@
+import os
+import sys
+import glob
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from tqdm import tqdm
+
+from accumulator import SegmentationAccumulator, load_class_names, DATA_YAML
+from metrics import match_files, print_match_report
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocessing_data"))
+from label_cache import LabelCache, open_label_cache, parse_label_file
+
+'''Scores the raw predicted class label maps (0 - background, class id + 1 - lobster, written by inference/sam2seg.py) straight
+against the YOLO-seg polygon labels (class_id x1 y1 x2 y2 ... normalised), without rendering or colour-thresholding anything.'''
+
+def read_yolo_polygons(label_path):
+    """
+    Read a YOLO-seg label file into a list of (class_id, polygon) with the polygon as an (N, 2) array of normalised points.
+    """
+    classes, polygons = parse_label_file(label_path)
+    return list(zip(classes, polygons))
+
+# cache dir -> (mtime of its index.json, LabelCache), one per (worker) process
+_label_caches = {}
+
+def cached_labels(cache_dir):
+    """
+    Memory-mapped label store, opened once per (worker) process and reopened when a rebuild swapped in a new index.
+    """
+    mtime_ns = os.stat(os.path.join(cache_dir, "index.json")).st_mtime_ns
+    cached = _label_caches.get(cache_dir)
+    if cached is None or cached[0] != mtime_ns:
+        # dropping the old store releases its memory maps, so the rebuild can delete its arrays
+        _label_caches[cache_dir] = (mtime_ns, LabelCache(cache_dir))
+    return _label_caches[cache_dir][1]
+
+def rasterize_labels(polygons, height, width):
+    """
+    Fill the polygons into a class label map (0 - background, class id + 1 - lobster) of the given size.
+    """
+    label_map = np.zeros((height, width), dtype=np.uint8)
+    scale = np.array([width, height], dtype=np.float32)
+    for class_id, points in polygons:
+        cv2.fillPoly(label_map, [np.round(points * scale).astype(np.int32)], int(class_id) + 1)
+    return label_map
+
+def confusion_matrix(gt_map, pred_map, num_labels):
+    """
+    Pixel confusion matrix (rows - ground truth, columns - prediction) for all labels in one bincount pass.
+    """
+    gt = np.minimum(gt_map.ravel(), num_labels - 1).astype(np.int64)
+    pred = np.minimum(pred_map.ravel(), num_labels - 1).astype(np.int64)
+    return np.bincount(gt * num_labels + pred, minlength=num_labels * num_labels).reshape(num_labels, num_labels)
+
+def score_label_pair(pair, num_labels, cache_dir=None):
+    """
+    Rasterize the labels of one image at the size of its predicted label map and return their confusion matrix (None if unreadable).
+    With a cache_dir the polygons come from the compiled label store instead of the text file.
+    """
+    image_id, label_file, pred_file = pair
+
+    pred_map = cv2.imread(pred_file, cv2.IMREAD_UNCHANGED)
+    if pred_map is None:
+        print(f"Warning: Could not read label map {pred_file}")
+        return None
+    if pred_map.ndim == 3:
+        pred_map = pred_map[:, :, 0]
+
+    polygons = cached_labels(cache_dir).polygons(image_id) if cache_dir else read_yolo_polygons(label_file)
+    gt_map = rasterize_labels(polygons, pred_map.shape[0], pred_map.shape[1])
+    return confusion_matrix(gt_map, pred_map, num_labels)
+
+def evaluate_label_maps(label_folder, pred_folder, data_yaml=DATA_YAML, workers=None, shard=None, save_path=None,
+                        use_cache=True):
+    """
+    Evaluate IoU and Dice for every class in data.yaml from the polygon labels and the predicted label maps.
+    use_cache reads the polygons from the label store of the folder (compiled or refreshed first, see label_cache.py).
+    shard=(index, count) only evaluates every count-th pair, and save_path stores the accumulator so shards run on
+    different machines can be merged with merge_shards.
+    """
+    class_names = load_class_names(data_yaml)
+    num_labels = len(class_names) + 1
+    label_files = glob.glob(os.path.join(label_folder, "*.txt"))
+    pred_files = glob.glob(os.path.join(pred_folder, "*.png"))
+    print(f"Found {len(label_files)} label files and {len(pred_files)} predicted label maps")
+
+    pairs, match_report = match_files(label_files, pred_files)
+    print_match_report(match_report)
+    if shard:
+        index, count = shard
+        pairs = pairs[index::count]
+
+    accumulator = SegmentationAccumulator(class_names)
+    cache_dir = open_label_cache(label_folder).cache_dir if use_cache else None
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    try:
+        args = ([num_labels] * len(pairs), [cache_dir] * len(pairs))
+        scores = pool.map(score_label_pair, pairs, *args, chunksize=max(1, len(pairs) // (workers * 8))) if pool \
+            else map(score_label_pair, pairs, *args)
+
+        for cm in tqdm(scores, total=len(pairs), desc="Evaluating label maps"):
+            if cm is not None:
+                accumulator.update_confusion(cm)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    if save_path:
+        accumulator.save(save_path)
+
+    if accumulator.images == 0:
+        print("No valid pairs of labels and predicted label maps were found.")
+        return accumulator
+
+    accumulator.print_results()
+    return accumulator
+
+def merge_shards(shard_paths):
+    """
+    Merge the accumulators saved by sharded evaluate_label_maps runs.
+    """
+    accumulator = SegmentationAccumulator.load(shard_paths[0])
+    for path in shard_paths[1:]:
+        accumulator.merge(SegmentationAccumulator.load(path))
+    return accumulator
+
+if __name__ == "__main__":
+    label_path = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\labels"
+    pred_path = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\inference\runs\fastsam_labels"
+
+    evaluate_label_maps(label_path, pred_path, workers=os.cpu_count())
@@ -1,10 +1,23 @@
 import os
+import sys
 import numpy as np
 import cv2
 import glob
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 
+from accumulator import SegmentationAccumulator, load_class_names, iou_dice, DATA_YAML
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from profiling import profiler
+
+# overlay colour of each class id, in the order of the names in data.yaml
+CLASS_COLOURS = ["blue", "red"]
+# comparison images waiting for the background writer before the scoring loop waits for it
+VIS_QUEUE = 16
+
 def extract_class_masks(image_path):
     """
     Extract binary masks for different classes based on color, whereas we get the most probable red and blue colour. Red - General/undefined lobster; Blue - Egg-berried lobsters.
@@ -51,23 +64,21 @@ def compute_iou_dice(gt_mask, pred_mask):
 
     return iou, dice
 
-def find_matching_file(image_id, file_list, prefixes=None):
+def pixel_counts(gt_mask, pred_mask):
     """
-    Find a matching file for the given image_id.
+    True positive, false positive and false negative pixel counts of a class mask, for the streaming accumulator.
     """
-    if prefixes:
-        for prefix in prefixes:
-            for file_path in file_list:
-                filename = os.path.basename(file_path)
-                if filename == f"{prefix}{image_id}":
-                    return file_path
+    gt_binary = gt_mask > 0
+    pred_binary = (pred_mask > 0).astype(np.uint8)
 
-    for file_path in file_list:
-        filename = os.path.basename(file_path)
-        if image_id in filename:
-            return file_path
-    
-    return None
+    if gt_binary.shape != pred_binary.shape:
+        print(f"Warning: Resizing prediction mask from {pred_binary.shape} to {gt_binary.shape}")
+        pred_binary = cv2.resize(pred_binary, (gt_binary.shape[1], gt_binary.shape[0]),
+                                interpolation=cv2.INTER_NEAREST)
+    pred_binary = pred_binary > 0
+
+    tp = np.count_nonzero(gt_binary & pred_binary)
+    return tp, np.count_nonzero(pred_binary) - tp, np.count_nonzero(gt_binary) - tp
 
 def extract_image_id(filename, prefixes=None):
     """
@@ -83,6 +94,68 @@ def extract_image_id(filename, prefixes=None):
     
     return base_name
 
+def build_file_index(files, prefixes=None):
+    """
+    Map every image ID to the files that carry it. Built once per folder so matching is a dict lookup instead of a scan over all files.
+    """
+    index = {}
+    for file_path in files:
+        image_id = extract_image_id(os.path.basename(file_path), prefixes)
+        index.setdefault(image_id, []).append(file_path)
+    return index
+
+def prefix_rank(filename, prefixes=None):
+    """
+    Position of the first prefix the filename starts with, files with the preferred prefix come first.
+    """
+    for rank, prefix in enumerate(prefixes or []):
+        if filename.startswith(prefix):
+            return rank
+    return len(prefixes or [])
+
+def pick_file(candidates, prefixes=None):
+    """
+    Deterministically pick one file when several share an image ID (e.g. segmented_img1.jpg and img1.jpg).
+    """
+    return min(candidates, key=lambda f: (prefix_rank(os.path.basename(f), prefixes), os.path.basename(f)))
+
+def match_files(gt_files, pred_files, gt_prefixes=None, pred_prefixes=None):
+    """
+    Pair ground truth and prediction files on exact image IDs (prefix and extension stripped), so img1 never matches img10.
+    Returns the sorted (image_id, gt_file, pred_file) pairs and a report of the unmatched and ambiguous IDs.
+    """
+    gt_index = build_file_index(gt_files, gt_prefixes)
+    pred_index = build_file_index(pred_files, pred_prefixes)
+
+    pairs = []
+    for image_id in sorted(gt_index.keys() & pred_index.keys()):
+        pairs.append((image_id, pick_file(gt_index[image_id], gt_prefixes), pick_file(pred_index[image_id], pred_prefixes)))
+
+    ambiguous = [image_id for image_id in sorted(gt_index.keys() | pred_index.keys())
+                 if len(gt_index.get(image_id, [])) > 1 or len(pred_index.get(image_id, [])) > 1]
+
+    report = {
+        "missing_prediction": sorted(gt_index.keys() - pred_index.keys()),
+        "missing_ground_truth": sorted(pred_index.keys() - gt_index.keys()),
+        "ambiguous": ambiguous,
+    }
+    return pairs, report
+
+def print_match_report(report, limit=10):
+    """
+    Print how many IDs could not be matched or matched more than one file, with the first few of each.
+    """
+    labels = {
+        "missing_prediction": "ground truth IDs without a prediction",
+        "missing_ground_truth": "prediction IDs without a ground truth",
+        "ambiguous": "ambiguous IDs (several files, picked by prefix then name)",
+    }
+    for key, label in labels.items():
+        ids = report[key]
+        if ids:
+            shown = ", ".join(ids[:limit]) + (", ..." if len(ids) > limit else "")
+            print(f"Warning: {len(ids)} {label}: {shown}")
+
 def visualize_masks(gt_file, pred_file, output_dir):
     """
     Save visualization of ground truth vs prediction masks for visual inspection.
@@ -111,133 +184,175 @@ def visualize_masks(gt_file, pred_file, output_dir):
     output_path = os.path.join(output_dir, f"comparison_{filename}")
     cv2.imwrite(output_path, comparison)
 
-def evaluate_masks(gt_folder, pred_folder, output_dir=None, gt_prefix="visualized_", pred_prefix="segmented_"):
+def score_pair(pair):
+    """
+    Score one (image_id, gt_file, pred_file) pair. Runs in the worker processes, so it only returns the per-class
+    (tp, fp, fn) pixel counts for blue and red, or None if one of the images could not be read.
+    """
+    image_id, gt_file, pred_file = pair
+
+    gt_masks = extract_class_masks(gt_file)
+    pred_masks = extract_class_masks(pred_file)
+    if gt_masks[0] is None or pred_masks[0] is None:
+        return None
+
+    counts = [pixel_counts(gt, pred) for gt, pred in zip(gt_masks, pred_masks)]
+    return tuple(zip(*counts))
+
+def score_pair_profiled(pair):
+    # serial path only, the worker processes have their own profiler that is never exported
+    with profiler.span("score_pair", image_id=pair[0]):
+        return score_pair(pair)
+
+def visualize_masks_profiled(gt_file, pred_file, output_dir):
+    with profiler.span("visualize_masks"):
+        visualize_masks(gt_file, pred_file, output_dir)
+
+def collect_visualization(future, image_id):
+    """
+    Wait for one comparison image of the background writer and report it if it failed.
+    """
+    try:
+        future.result()
+    except Exception as e:
+        print(f"Warning: Could not save the comparison image of {image_id}: {e}")
+
+def evaluate_masks(gt_folder, pred_folder, output_dir=None, gt_prefix="visualized_", pred_prefix="segmented_", workers=None,
+                   data_yaml=DATA_YAML, keep_individual=False):
     """
     Evaluate IoU and Dice scores for both classes with improved matching and visualization.
+    With workers > 1 the pairs are scored across a process pool; the scores are still aggregated in the sorted pair order.
+    Memory stays constant in the number of images unless keep_individual also collects the per-image scores.
     """
+    class_names = load_class_names(data_yaml)
+    if len(class_names) != len(CLASS_COLOURS):
+        raise ValueError(f"Colour masks only separate {len(CLASS_COLOURS)} classes, got {class_names}; "
+                         f"use label_eval.py to score any number of classes")
+
     gt_prefixes = [gt_prefix, ""] 
     pred_prefixes = [pred_prefix, ""] 
     
     # Find all image files( we have to use .png and jpg, but this function adds various format for future work expansion)
     extensions = ['.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff']
-    gt_files = []
-    for ext in extensions:
-        gt_files.extend(glob.glob(os.path.join(gt_folder, f"*{ext}")))
-    
-    pred_files = []
-    for ext in extensions:
-        pred_files.extend(glob.glob(os.path.join(pred_folder, f"*{ext}")))
+    with profiler.span("list_files"):
+        gt_files = []
+        for ext in extensions:
+            gt_files.extend(glob.glob(os.path.join(gt_folder, f"*{ext}")))
+
+        pred_files = []
+        for ext in extensions:
+            pred_files.extend(glob.glob(os.path.join(pred_folder, f"*{ext}")))
     
     print(f"Found {len(gt_files)} ground truth files and {len(pred_files)} prediction files")
     
-    iou_scores, dice_scores = {"blue": [], "red": []}, {"blue": [], "red": []}
+    # Running pixel counts per class; the per-image scores of the two colours only if asked for
+    accumulator = SegmentationAccumulator(class_names)
+    individual_scores = None
+    if keep_individual:
+        individual_scores = {f"{metric}_{colour}": [] for colour in CLASS_COLOURS for metric in ("iou", "dice")}
     matched_count = 0
     
     
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
     
-    # Progress bar
-    for gt_file in tqdm(gt_files, desc="Evaluating masks"):
-        gt_filename = os.path.basename(gt_file)
-        
-      
-        image_id = extract_image_id(gt_filename, gt_prefixes)
-        
-   
-        pred_file = find_matching_file(image_id, pred_files, pred_prefixes)
-        
-        if pred_file:
-            print(f"Matching: {gt_filename} with {os.path.basename(pred_file)}")
+    # Match once through an ID index instead of scanning the predictions for every ground truth
+    with profiler.span("match_files"):
+        pairs, match_report = match_files(gt_files, pred_files, gt_prefixes, pred_prefixes)
+    print_match_report(match_report)
+
+    # Comparison images are written by a background thread so they never hold up the scoring
+    vis_pool = ThreadPoolExecutor(max_workers=1) if output_dir else None
+    vis_futures = deque()
+    score_pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+
+    # map keeps the pair order, so the aggregated scores do not depend on which worker finished first
+    if score_pool:
+        scores = score_pool.map(score_pair, pairs, chunksize=max(1, len(pairs) // (workers * 8)))
+    else:
+        scores = map(score_pair_profiled, pairs)
+
+    try:
+        # One progress bar instead of a print per image
+        progress = tqdm(zip(pairs, scores), total=len(pairs), desc="Evaluating masks")
+        for (image_id, gt_file, pred_file), score in progress:
             matched_count += 1
-            
-            # Extract the masks 
-            gt_blue, gt_red = extract_class_masks(gt_file)
-            pred_blue, pred_red = extract_class_masks(pred_file)
-            
-            if gt_blue is not None and pred_blue is not None:
-                # Compute IoU and Dice scores for the masks
-                iou_b, dice_b = compute_iou_dice(gt_blue, pred_blue)
-                iou_r, dice_r = compute_iou_dice(gt_red, pred_red)
-                
-                iou_scores["blue"].append(iou_b)
-                dice_scores["blue"].append(dice_b)
-                iou_scores["red"].append(iou_r)
-                dice_scores["red"].append(dice_r)
-                
-                print(f"{image_id} - IoU (Blue): {iou_b:.4f}, Dice (Blue): {dice_b:.4f} | IoU (Red): {iou_r:.4f}, Dice (Red): {dice_r:.4f}")
-                
-                
-                if output_dir:
-                    visualize_masks(gt_file, pred_file, output_dir)
-        else:
-            print(f"Warning: No prediction found for {gt_filename} (ID: {image_id})")
-    
+            profiler.count("pairs")
+            if score is None:
+                profiler.count("unreadable_pairs")
+                continue
+
+            with profiler.span("accumulate"):
+                accumulator.update(*score)
+                if keep_individual:
+                    for c, (iou, dice) in enumerate(zip(*iou_dice(*score))):
+                        individual_scores[f"iou_{CLASS_COLOURS[c]}"].append(float(iou))
+                        individual_scores[f"dice_{CLASS_COLOURS[c]}"].append(float(dice))
+
+            if vis_pool:
+                vis_futures.append((vis_pool.submit(visualize_masks_profiled, gt_file, pred_file, output_dir), image_id))
+                # bounded, so a slow disk makes the scoring wait instead of queueing every pair in memory
+                while len(vis_futures) > VIS_QUEUE:
+                    collect_visualization(*vis_futures.popleft())
+    finally:
+        if score_pool:
+            score_pool.shutdown()
+        if vis_pool:
+            vis_pool.shutdown()
+            while vis_futures:
+                collect_visualization(*vis_futures.popleft())
+
     print(f"\nSuccessfully matched {matched_count} file pairs out of {len(gt_files)} ground truth files")
     
     # Compute the metrics
-    if not iou_scores["blue"]:
+    if accumulator.images == 0:
         print("No valid pairs of ground truth and prediction masks were found.")
         return
     
+    results = accumulator.results()
+    blue, red = (results["classes"][name] for name in class_names)
 
-    mean_iou_blue = np.mean(iou_scores['blue'])
-    mean_dice_blue = np.mean(dice_scores['blue'])
-    mean_iou_red = np.mean(iou_scores['red'])
-    mean_dice_red = np.mean(dice_scores['red'])
-    
     print("\nFinal Evaluation:")
-    print(f"Mean IoU (Blue): {mean_iou_blue:.4f}, Mean Dice (Blue): {mean_dice_blue:.4f}")
-    print(f"Mean IoU (Red): {mean_iou_red:.4f}, Mean Dice (Red): {mean_dice_red:.4f}")
-    
+    print(f"Mean IoU (Blue): {blue['mean_image_iou']:.4f}, Mean Dice (Blue): {blue['mean_image_dice']:.4f}")
+    print(f"Mean IoU (Red): {red['mean_image_iou']:.4f}, Mean Dice (Red): {red['mean_image_dice']:.4f}")
+    accumulator.print_results()
 
     if output_dir:
-        generate_metrics_visualization(iou_scores, dice_scores, output_dir)
+        with profiler.span("metrics_visualization"):
+            generate_metrics_visualization(accumulator, output_dir)
     
     return {
-        "iou_blue": mean_iou_blue,
-        "dice_blue": mean_dice_blue,
-        "iou_red": mean_iou_red,
-        "dice_red": mean_dice_red,
-        "individual_scores": {
-            "iou_blue": iou_scores["blue"],
-            "dice_blue": dice_scores["blue"],
-            "iou_red": iou_scores["red"],
-            "dice_red": dice_scores["red"]
-        }
+        "iou_blue": blue["mean_image_iou"],
+        "dice_blue": blue["mean_image_dice"],
+        "iou_red": red["mean_image_iou"],
+        "dice_red": red["mean_image_dice"],
+        "individual_scores": individual_scores,
+        "metrics": results,
+        "accumulator": accumulator,
+        "match_report": match_report
     }
 
-def generate_metrics_visualization(iou_scores, dice_scores, output_dir):
+def generate_metrics_visualization(accumulator, output_dir):
     """
-    Generate and save visualizations of evaluation metrics.
+    Generate and save visualizations of evaluation metrics from the accumulator's per-image score histograms.
     """
-    # Create a figure with subplots
-    fig, axs = plt.subplots(2, 2, figsize=(14, 10))
-    
-    # Plot IoU scores and Dice scores for the Blue(egg-berried lobsters) 
-    axs[0, 0].hist(iou_scores["blue"], bins=20, color='blue', alpha=0.7)
-    axs[0, 0].set_title(f"IoU Scores - Blue Class (Mean: {np.mean(iou_scores['blue']):.4f})")
-    axs[0, 0].set_xlabel("IoU Score")
-    axs[0, 0].set_ylabel("Frequency")
+    class_names = accumulator.class_names
+    bins = accumulator.iou_hist.shape[1]
+    edges = np.linspace(0, 1, bins + 1)
+    images = max(accumulator.images, 1)
 
-    axs[0, 1].hist(dice_scores["blue"], bins=20, color='blue', alpha=0.7)
-    axs[0, 1].set_title(f"Dice Scores - Blue Class (Mean: {np.mean(dice_scores['blue']):.4f})")
-    axs[0, 1].set_xlabel("Dice Score")
-    axs[0, 1].set_ylabel("Frequency")
-    
-      # Plot IoU scores and Dice scores for the Blue(generic lobsters) 
-    axs[1, 0].hist(iou_scores["red"], bins=20, color='red', alpha=0.7)
-    axs[1, 0].set_title(f"IoU Scores - Red Class (Mean: {np.mean(iou_scores['red']):.4f})")
-    axs[1, 0].set_xlabel("IoU Score")
-    axs[1, 0].set_ylabel("Frequency")
-    
+    # Create a figure with subplots, one row per class (Blue - egg-berried lobsters, Red - generic lobsters)
+    fig, axs = plt.subplots(len(class_names), 2, figsize=(14, 5 * len(class_names)), squeeze=False)
+
+    for c, name in enumerate(class_names):
+        colour = CLASS_COLOURS[c % len(CLASS_COLOURS)]
+        for col, (metric, hist, total) in enumerate((("IoU", accumulator.iou_hist[c], accumulator.image_iou_sum[c]),
+                                                     ("Dice", accumulator.dice_hist[c], accumulator.image_dice_sum[c]))):
+            axs[c, col].bar(edges[:-1], hist, width=1 / bins, align='edge', color=colour, alpha=0.7)
+            axs[c, col].set_title(f"{metric} Scores - {colour.capitalize()} Class ({name}) (Mean: {total / images:.4f})")
+            axs[c, col].set_xlabel(f"{metric} Score")
+            axs[c, col].set_ylabel("Frequency")
 
-    axs[1, 1].hist(dice_scores["red"], bins=20, color='red', alpha=0.7)
-    axs[1, 1].set_title(f"Dice Scores - Red Class (Mean: {np.mean(dice_scores['red']):.4f})")
-    axs[1, 1].set_xlabel("Dice Score")
-    axs[1, 1].set_ylabel("Frequency")
-    
-    
     plt.tight_layout()
     plt.savefig(os.path.join(output_dir, "evaluation_metrics.png"))
     plt.close()
@@ -247,4 +362,5 @@ if __name__ == "__main__":
     pred_path = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\inference\runs\fastsam"
     output_path = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_results\fastsam"
     
-    evaluate_masks(gt_path, pred_path, output_path)
\ No newline at end of file
+    evaluate_masks(gt_path, pred_path, output_path, workers=os.cpu_count())
+    profiler.export("evaluate_masks")
\ No newline at end of file
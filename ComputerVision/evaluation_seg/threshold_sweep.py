@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import numpy as np
+from tqdm import tqdm
+
+from accumulator import load_class_names, DATA_YAML
+from box_eval import IOU_THRESHOLDS, match_predictions, average_precision
+from label_eval import rasterize_labels
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocessing_data"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "inference"))
+from label_cache import open_label_cache
+from prediction_cache import load_predictions
+from mask_store import read_records, decode_mask
+
+'''Offline confidence-threshold sweep over a raw-prediction cache (inference/prediction_cache.py) and the YOLO labels (detection
+boxes or seg polygons, read as in box_eval.py).
+The predictions are matched to the labels once, at the confidence floor of the cache; every threshold is then a cut of the
+score-sorted predictions, so precision, recall, F1, AP50 and AP50-95 per class come out for dozens of thresholds in one pass.
+With the masks of a segmentation model cached as well, pixel IoU and Dice per class are swept the same way: every pixel keeps
+the highest score of the instances of a class covering it, and one histogram per image gives its counts at all thresholds.
+A pixel predicted for both classes counts for both.'''
+
+THRESHOLDS = np.round(np.arange(0.05, 0.951, 0.025), 3)
+
+def match_cache(predictions, label_folder, iou_thresholds=IOU_THRESHOLDS):
+    """
+    True positive flags (N, T) of every cached prediction and the classes of the ground truth boxes. The labels are read
+    the same way as box_eval.evaluate_boxes does (detection or polygon lines), so both score a cache identically.
+    """
+    _, tp, gt_classes = match_predictions(predictions, label_folder, iou_thresholds)
+    if len(gt_classes) == 0:
+        raise ValueError(f"No ground truth boxes in {label_folder} for the {len(predictions['names'])} cached images, "
+                         f"check the label folder and the image names")
+    return tp, gt_classes
+
+def sweep_boxes(predictions, tp, gt_classes, num_classes, thresholds=THRESHOLDS):
+    """
+    Precision, recall, F1, AP50 and AP50-95 per class (C, len(thresholds)).
+    """
+    shape = (num_classes, len(thresholds))
+    results = {key: np.full(shape, np.nan) for key in ["precision", "recall", "f1", "ap50", "ap50_95"]}
+
+    for c in range(num_classes):
+        num_gt = int(np.count_nonzero(gt_classes == c))
+        of_class = predictions["classes"] == c
+        order = np.argsort(-predictions["scores"][of_class], kind="stable")
+        scores, class_tp = predictions["scores"][of_class][order], tp[of_class][order]
+
+        # number of predictions with score >= each threshold, the scores are sorted descending
+        kept = np.searchsorted(-scores, -np.asarray(thresholds), side="right")
+        tp50 = np.concatenate([[0], np.cumsum(class_tp[:, 0])])[kept]
+        results["precision"][c] = np.where(kept > 0, tp50 / np.maximum(kept, 1), np.nan)
+        results["recall"][c] = tp50 / num_gt if num_gt else np.nan
+        p, r = results["precision"][c], results["recall"][c]
+        results["f1"][c] = np.where(p + r > 0, 2 * p * r / np.maximum(p + r, 1e-9), 0.0)
+
+        for t, k in enumerate(kept):
+            aps = average_precision(class_tp[:k], num_gt)
+            results["ap50"][c, t], results["ap50_95"][c, t] = aps[0], np.mean(aps)
+
+    return results
+
+def image_mask_counts(record, polygons, num_classes, thresholds=THRESHOLDS):
+    """
+    Per class pixel counts of one image at every threshold: true positives (C, T), predicted (C, T), ground truth (C).
+    """
+    height, width = record["height"], record["width"]
+    gt_map = rasterize_labels(polygons, height, width)
+    thresholds = np.asarray(thresholds)
+
+    tp = np.zeros((num_classes, len(thresholds)), dtype=np.int64)
+    pred = np.zeros((num_classes, len(thresholds)), dtype=np.int64)
+    gt = np.array([np.count_nonzero(gt_map == c + 1) for c in range(num_classes)], dtype=np.int64)
+
+    for c in range(num_classes):
+        score_map = np.zeros((height, width), dtype=np.float32)
+        for entry in record["instances"]:
+            if entry["class_id"] == c:
+                mask = decode_mask(entry, height, width)
+                score_map[mask] = np.maximum(score_map[mask], entry["confidence"])
+
+        covered = score_map > 0
+        if not covered.any():
+            continue
+        # a pixel with score s is predicted at every threshold <= s: bincount of that count, summed from the top
+        levels = np.searchsorted(thresholds, score_map[covered], side="right")
+        on_gt = gt_map[covered] == c + 1
+        pred[c] = np.cumsum(np.bincount(levels, minlength=len(thresholds) + 1)[::-1])[::-1][1:]
+        tp[c] = np.cumsum(np.bincount(levels[on_gt], minlength=len(thresholds) + 1)[::-1])[::-1][1:]
+
+    return tp, pred, gt
+
+def sweep_masks(mask_path, labels, num_classes, thresholds=THRESHOLDS):
+    """
+    Dataset-level pixel IoU and Dice per class (C, len(thresholds)).
+    """
+    tp = np.zeros((num_classes, len(thresholds)), dtype=np.int64)
+    pred = np.zeros_like(tp)
+    gt = np.zeros(num_classes, dtype=np.int64)
+
+    for name, record in tqdm(read_records(mask_path).items(), desc="Sweeping masks"):
+        counts = image_mask_counts(record, labels.polygons(os.path.splitext(name)[0]), num_classes, thresholds)
+        tp, pred, gt = tp + counts[0], pred + counts[1], gt + counts[2]
+
+    union = pred + gt[:, None] - tp
+    return {
+        "iou": np.where(union > 0, tp / np.maximum(union, 1), 1.0),
+        "dice": np.where(pred + gt[:, None] > 0, 2 * tp / np.maximum(pred + gt[:, None], 1), 1.0),
+    }
+
+def print_sweep(results, class_names, thresholds=THRESHOLDS, every=2):
+    keys = [k for k in ["precision", "recall", "f1", "ap50", "ap50_95", "iou", "dice"] if k in results]
+    for c, name in enumerate(class_names):
+        print(f"\n{name}")
+        print(f"{'conf':>6}" + "".join(f"{k:>10}" for k in keys))
+        for t in range(0, len(thresholds), every):
+            print(f"{thresholds[t]:>6.3f}" + "".join(f"{results[k][c, t]:>10.4f}" for k in keys))
+        if "f1" in results and not np.all(np.isnan(results["f1"][c])):
+            best = int(np.nanargmax(results["f1"][c]))
+            print(f"Best F1 {results['f1'][c, best]:.4f} at conf {thresholds[best]:.3f}")
+
+def threshold_sweep(cache_path, label_folder, data_yaml=DATA_YAML, thresholds=THRESHOLDS, report_path=None):
+    """
+    Sweep the confidence thresholds of a prediction cache against a label folder (and its masks, if they were cached).
+    """
+    class_names = load_class_names(data_yaml)
+    predictions = load_predictions(cache_path)
+    floor = float(predictions["conf_floor"])
+    if thresholds[0] < floor:
+        print(f"Warning: thresholds below the cache floor {floor} see the same predictions as the floor")
+
+    tp, gt_classes = match_cache(predictions, label_folder)
+    results = sweep_boxes(predictions, tp, gt_classes, len(class_names), thresholds)
+
+    mask_path = os.path.splitext(cache_path)[0] + ".masks.jsonl"
+    if os.path.exists(mask_path):
+        # pixel IoU/Dice need the polygons, from the compiled label store
+        results.update(sweep_masks(mask_path, open_label_cache(label_folder), len(class_names), thresholds))
+
+    print_sweep(results, class_names, thresholds)
+
+    if report_path:
+        report = {
+            "cache": cache_path,
+            "labels": label_folder,
+            "thresholds": [float(t) for t in thresholds],
+            "classes": {name: {key: [None if np.isnan(v) else float(v) for v in values[c]] for key, values in results.items()}
+                        for c, name in enumerate(class_names)},
+        }
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Sweep saved to {report_path}")
+    return results
+
+if __name__ == "__main__":
+    label_path = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\labels"
+    cache_path = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\inference\predictions_yolo11seg_segGT.npz"
+
+    threshold_sweep(cache_path, label_path, report_path="threshold_sweep_yolo11seg.json")
@@ -1,87 +1,129 @@
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon
 from matplotlib.collections import PatchCollection
 
-# Paths
-image_folder = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\images"
-label_folder = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\labels"
-output_folder = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\visualized_masks_v2"
+from label_eval import cached_labels, read_yolo_polygons
 
-os.makedirs(output_folder, exist_ok=True)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocessing_data"))
+from label_cache import open_label_cache
 
 colors = [
     (0, 0, 1, 0.5), # Blue - egg-berried  lobster
     (1, 0, 0, 0.5)   # Red - general/undefined lobster
 ]
 '''Something that needs to be noted is the following: the format of the labels in the folder are in the format of YOLO-11/YOLO-12 for image segmentation, which means class_id, polygons. '''
-# Process files
-for image_file in os.listdir(image_folder):
-    if image_file.lower().endswith(('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')):
-        # Get the label
-        base_name = os.path.splitext(image_file)[0]
-        label_file = base_name + ".txt"
-        label_path = os.path.join(label_folder, label_file)
-        
-
-        if not os.path.exists(label_path):
-            print(f"No label file for {image_file}. Skipping...")
-            continue
-            
-        # Read image
-        img_path = os.path.join(image_folder, image_file)
-        img = cv2.imread(img_path)
-        if img is None:
-            print(f"Could not read image {image_file}. Skipping...")
-            continue
-            
-        #from BGR to RGB 
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Get image dimensions for normalization
-        img_height, img_width = img.shape[:2]
-        
-        # Create figure and axis
-        fig, ax = plt.subplots(figsize=(10, 10))
-        ax.imshow(img)
-       
-        polygons = []
-        polygon_colors = []
-      
-        with open(label_path, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) < 5:  
-                    continue
-                    
-                class_id = int(parts[0])
-                # we find the polygon coordinates
-                polygon_points = []
-                for i in range(1, len(parts), 2):
-                    if i+1 < len(parts):
-                        x = float(parts[i]) * img_width
-                        y = float(parts[i+1]) * img_height
-                        polygon_points.append((x, y))
-                
-                if len(polygon_points) > 2: 
-                    polygons.append(Polygon(np.array(polygon_points)))
-                    polygon_colors.append(colors[class_id % len(colors)])
-        
-        # add the polygon to the image
-        p = PatchCollection(polygons, facecolors=polygon_colors, edgecolors=(0,0,0,1), linewidths=2)
-        ax.add_collection(p)
-        
-        # adding title of image
-        ax.set_title(f'Image: {image_file}')
-        ax.axis('off')
-
-        output_path = os.path.join(output_folder, f"visualized_{base_name}.png")
-        plt.tight_layout()
-        plt.savefig(output_path, dpi=150)
-        plt.close()
-        
-        print(f"Saved visualization for {image_file}")
-
-print("Visualization complete!")
\ No newline at end of file
+
+# "opencv" draws the polygons straight onto the image at native resolution, "matplotlib" is the original figure renderer
+RENDER_MODE = "opencv"
+
+def render_matplotlib(img, polygons, image_file, output_path):
+    """
+    Draw the polygons with matplotlib patches and save the figure at dpi=150.
+    """
+    #from BGR to RGB
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img_height, img_width = img.shape[:2]
+
+    # Create figure and axis
+    fig, ax = plt.subplots(figsize=(10, 10))
+    ax.imshow(img)
+
+    patches = [Polygon(points * [img_width, img_height]) for _, points in polygons]
+    polygon_colors = [colors[class_id % len(colors)] for class_id, _ in polygons]
+
+    # add the polygon to the image
+    p = PatchCollection(patches, facecolors=polygon_colors, edgecolors=(0,0,0,1), linewidths=2)
+    ax.add_collection(p)
+
+    # adding title of image
+    ax.set_title(f'Image: {image_file}')
+    ax.axis('off')
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=150)
+    plt.close()
+
+def render_opencv(img, polygons):
+    """
+    Fill the polygons with the class colours at 50% opacity and outline them in black, directly on the image array.
+    """
+    overlay = img.copy()
+    scale = np.array([img.shape[1], img.shape[0]], dtype=np.float32)
+    outlines = []
+
+    for class_id, points in polygons:
+        r, g, b, alpha = colors[class_id % len(colors)]
+        pts = np.round(points * scale).astype(np.int32)
+        cv2.fillPoly(overlay, [pts], (int(b * 255), int(g * 255), int(r * 255)), lineType=cv2.LINE_AA)
+        outlines.append(pts)
+
+    # every colour in the scheme has the same alpha, so one blend covers all the polygons
+    alpha = colors[0][3]
+    rendered = cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0)
+    cv2.polylines(rendered, outlines, isClosed=True, color=(0, 0, 0), thickness=2, lineType=cv2.LINE_AA)
+    return rendered
+
+def visualise_image(image_file, image_folder, label_folder, output_folder, mode=RENDER_MODE, cache_dir=None):
+    """
+    Render the ground truth polygons of one image. Returns a status message so the worker processes do not print.
+    With a cache_dir the polygons come from the compiled label store instead of the text file.
+    """
+    # Get the label
+    base_name = os.path.splitext(image_file)[0]
+    label_path = os.path.join(label_folder, base_name + ".txt")
+
+    has_label = base_name in cached_labels(cache_dir) if cache_dir else os.path.exists(label_path)
+    if not has_label:
+        return f"No label file for {image_file}. Skipping..."
+
+    # Read image
+    img = cv2.imread(os.path.join(image_folder, image_file))
+    if img is None:
+        return f"Could not read image {image_file}. Skipping..."
+
+    polygons = cached_labels(cache_dir).polygons(base_name) if cache_dir else read_yolo_polygons(label_path)
+    output_path = os.path.join(output_folder, f"visualized_{base_name}.png")
+
+    if mode == "matplotlib":
+        render_matplotlib(img, polygons, image_file, output_path)
+    else:
+        cv2.imwrite(output_path, render_opencv(img, polygons))
+
+    return None
+
+def visualise_folder(image_folder, label_folder, output_folder, mode=RENDER_MODE, workers=None, use_cache=True):
+    """
+    Render every labelled image of a folder across a process pool.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    cache_dir = open_label_cache(label_folder).cache_dir if use_cache else None
+    image_files = [f for f in sorted(os.listdir(image_folder))
+                   if f.lower().endswith(('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp'))]
+
+    n = len(image_files)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        messages = pool.map(visualise_image, image_files, [image_folder] * n, [label_folder] * n,
+                            [output_folder] * n, [mode] * n, [cache_dir] * n, chunksize=max(1, n // 64))
+        saved = 0
+        for message in messages:
+            if message:
+                print(message)
+            else:
+                saved += 1
+
+    print(f"Saved {saved} visualizations")
+
+if __name__ == "__main__":
+    # Paths
+    image_folder = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\images"
+    label_folder = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\labels"
+    output_folder = r"C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\visualized_masks_v2"
+
+    visualise_folder(image_folder, label_folder, output_folder)
+
+    print("Visualization complete!")
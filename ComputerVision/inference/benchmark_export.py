@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import queue
+import time
+import tempfile
+import multiprocessing as mp
+
+import cv2
+import numpy as np
+
+from executor import list_images
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from box_ops import box_iou
+
+'''Benchmarks an Ultralytics .pt model against its TFLite exports (tfliteconvert.py, YOLO11-seg/exporttotflite.py) on a fixed
+local image set, on CPU. Every (variant, thread count) runs in its own process so the peak RSS and the thread settings of one
+run do not leak into the next. Reports model load and warm-up time, p50/p95/p99 latency, images/sec and peak RSS, plus how
+well the boxes and masks of every export agree with the .pt baseline.'''
+
+NUM_IMAGES = 50
+WARMUP = 3
+THREADS = [1, 2, 4]
+IMGSZ = 640
+CONF = 0.25
+
+def export_variants(pt_path):
+    """
+    The .pt model and the TFLite files Ultralytics writes next to it (<name>_saved_model/<name>_<precision>.tflite).
+    """
+    name = os.path.splitext(os.path.basename(pt_path))[0]
+    saved_model = os.path.join(os.path.dirname(pt_path), f"{name}_saved_model")
+    return {
+        "pt": pt_path,
+        "tflite_fp32": os.path.join(saved_model, f"{name}_float32.tflite"),
+        "tflite_fp16": os.path.join(saved_model, f"{name}_float16.tflite"),
+        "tflite_int8": os.path.join(saved_model, f"{name}_int8.tflite"),
+        "tflite_full_int8": os.path.join(saved_model, f"{name}_full_integer_quant.tflite"),
+    }
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB (None if it cannot be measured on this platform).
+    """
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 if os.uname().sysname != "Darwin" else rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+def limit_threads(num_threads):
+    """
+    Pin torch and the TFLite interpreter (which Ultralytics creates without a thread count) to num_threads.
+    """
+    import torch
+    torch.set_num_threads(num_threads)
+
+    def with_threads(base):
+        class Interpreter(base):
+            def __init__(self, *args, **kwargs):
+                kwargs.setdefault("num_threads", num_threads)
+                super().__init__(*args, **kwargs)
+        return Interpreter
+
+    try:
+        import tflite_runtime.interpreter as tflite_runtime
+        tflite_runtime.Interpreter = with_threads(tflite_runtime.Interpreter)
+    except ImportError:
+        pass
+    try:
+        import tensorflow as tf
+        tf.lite.Interpreter = with_threads(tf.lite.Interpreter)
+    except ImportError:
+        pass
+
+def label_map(result):
+    """
+    Class label map (0 - background, class id + 1) of a segmentation result at the original image size, None for detection models.
+    """
+    if result.masks is None:
+        return None
+    height, width = result.orig_shape
+    labels = np.zeros((height, width), dtype=np.uint8)
+    for mask, class_id in zip(result.masks.data.cpu().numpy(), result.boxes.cls.cpu().numpy().astype(int)):
+        if mask.shape != (height, width):
+            mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+        labels[mask > 0.5] = class_id + 1
+    return labels
+
+def run_variant(model_path, image_paths, num_threads, imgsz, conf, predictions_path, results):
+    """
+    Child process: load the model, warm it up and time one image per call. Saves the predictions for the agreement check.
+    """
+    limit_threads(num_threads)
+    from ultralytics import YOLO
+
+    frames = [cv2.imread(p) for p in image_paths]
+
+    start = time.perf_counter()
+    model = YOLO(model_path)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for frame in frames[:WARMUP]:
+        model(frame, imgsz=imgsz, conf=conf, verbose=False)
+    warmup_time = time.perf_counter() - start
+
+    latencies, predictions = [], {}
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        t0 = time.perf_counter()
+        result = model(frame, imgsz=imgsz, conf=conf, verbose=False)[0]
+        latencies.append(time.perf_counter() - t0)
+
+        predictions[f"boxes_{i}"] = result.boxes.xyxy.cpu().numpy()
+        predictions[f"cls_{i}"] = result.boxes.cls.cpu().numpy().astype(int)
+        labels = label_map(result)
+        if labels is not None:
+            predictions[f"mask_{i}"] = labels
+    total = time.perf_counter() - start
+
+    np.savez_compressed(predictions_path, **predictions)
+    results.put({
+        "load_s": load_time,
+        "warmup_s": warmup_time,
+        "latencies_ms": [t * 1000 for t in latencies],
+        "images_per_sec": len(frames) / total,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+def box_agreement(base_boxes, base_cls, boxes, cls, iou_threshold=0.5):
+    """
+    Greedy same-class matching against the baseline boxes. Returns (matched, baseline count, variant count, summed IoU of the matches).
+    """
+    if len(base_boxes) == 0 or len(boxes) == 0:
+        return 0, len(base_boxes), len(boxes), 0.0
+
+    iou = box_iou(base_boxes, boxes) * (base_cls[:, None] == cls[None, :])
+    matched, iou_sum = 0, 0.0
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        matched += 1
+        iou_sum += iou[i, j]
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matched, len(base_boxes), len(boxes), iou_sum
+
+def agreement(base_path, variant_path, num_images):
+    """
+    Box F1 / mean matched IoU and mask pixel IoU of a variant against the baseline predictions.
+    """
+    base, other = np.load(base_path), np.load(variant_path)
+    matched = n_base = n_other = 0
+    iou_sum = 0.0
+    inter = union = 0
+
+    for i in range(num_images):
+        m, nb, no, s = box_agreement(base[f"boxes_{i}"], base[f"cls_{i}"], other[f"boxes_{i}"], other[f"cls_{i}"])
+        matched, n_base, n_other, iou_sum = matched + m, n_base + nb, n_other + no, iou_sum + s
+
+        if f"mask_{i}" in base and f"mask_{i}" in other:
+            a, b = base[f"mask_{i}"], other[f"mask_{i}"]
+            inter += np.count_nonzero((a == b) & (a > 0))
+            union += np.count_nonzero((a > 0) | (b > 0))
+
+    precision = matched / n_other if n_other else 1.0
+    recall = matched / n_base if n_base else 1.0
+    return {
+        "box_f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "box_mean_iou": iou_sum / matched if matched else 0.0,
+        "mask_iou": inter / union if union else None,
+    }
+
+def benchmark(pt_path, image_dir, threads=THREADS, num_images=NUM_IMAGES, imgsz=IMGSZ, conf=CONF, report_path=None):
+    """
+    Run every available variant of the model at every thread count and compare the exports with the .pt baseline.
+    """
+    image_paths = list_images(image_dir)[:num_images]
+    variants = {name: path for name, path in export_variants(pt_path).items() if os.path.exists(path)}
+    for name, path in export_variants(pt_path).items():
+        if name not in variants:
+            print(f"Skipping {name}: {path} not found")
+
+    ctx = mp.get_context("spawn")
+    report = {"model": pt_path, "images": len(image_paths), "imgsz": imgsz, "runs": []}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, path in variants.items():
+            for num_threads in threads:
+                predictions_path = os.path.join(tmp, f"{name}_{num_threads}.npz")
+                results = ctx.Queue()
+                child = ctx.Process(target=run_variant, args=(path, image_paths, num_threads, imgsz, conf, predictions_path, results))
+                child.start()
+                stats = None
+                while stats is None:
+                    try:
+                        stats = results.get(timeout=1)
+                    except queue.Empty:
+                        if not child.is_alive():
+                            raise RuntimeError(f"Benchmark of {name} with {num_threads} threads exited with code {child.exitcode}")
+                child.join()
+
+                p50, p95, p99 = np.percentile(stats.pop("latencies_ms"), [50, 95, 99])
+                run = {"variant": name, "threads": num_threads, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, **stats}
+                if name != "pt" and "pt" in variants:
+                    run.update(agreement(os.path.join(tmp, f"pt_{num_threads}.npz"), predictions_path, len(image_paths)))
+                report["runs"].append(run)
+                print(format_run(run))
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def format_run(run):
+    rss = f"{run['peak_rss_mb']:.0f}MB" if run["peak_rss_mb"] is not None else "n/a"
+    line = (f"{run['variant']:<12} threads={run['threads']:<2} load {run['load_s']:.2f}s warm-up {run['warmup_s']:.2f}s | "
+            f"p50 {run['p50_ms']:.1f}ms p95 {run['p95_ms']:.1f}ms p99 {run['p99_ms']:.1f}ms | "
+            f"{run['images_per_sec']:.2f} img/s | peak RSS {rss}")
+    if "box_f1" in run:
+        mask = f"{run['mask_iou']:.3f}" if run["mask_iou"] is not None else "n/a"
+        line += f" | box F1 {run['box_f1']:.3f} box IoU {run['box_mean_iou']:.3f} mask IoU {mask}"
+    return line
+
+if __name__ == "__main__":
+    image_dir = r'C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\images'
+
+    benchmark("FastSAM-s.pt", image_dir, report_path="benchmark_fastsam.json")
+    benchmark(os.path.join("..", "evaluation_seg", "YOLO11-seg", "yolo11n-egg_noeggseg.pt"), image_dir,
+              report_path="benchmark_yolo11seg.json")
@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import tempfile
+import subprocess
+
+import cv2
+import numpy as np
+
+from executor import list_images
+from sam2seg import (CONF, PADDING, CROP_IMGSZ, detect, validate_boxes, segment_detections, segment_crops, blend_instances,
+                     label_map)
+
+'''Per-stage latency benchmark of the sam2seg.py pipeline. Every image of a folder is replayed through the pipeline one stage
+at a time (decode, YOLO, box validation/padding, FastSAM, blending, imwrite) and the wall time of each stage is recorded per
+image and per detection. The JSON report carries the git commit, so two reports can be compared with compare_reports.
+
+The synthetic mode generates images with a known number of lobster-like blobs and feeds their boxes to FastSAM instead of
+the YOLO boxes (YOLO still runs and is timed), which shows how the cost grows with the detections per image.
+
+crop_agreement compares the crop mode of sam2seg (FastSAM on each padded box at CROP_IMGSZ) with the full-image FastSAM
+pass: the time of both and the IoU of the masks they give for the same boxes.'''
+
+STAGES = ["decode", "yolo", "validate", "fastsam", "blend", "write"]
+WARMUP = 3
+SYNTHETIC_BOXES = [0, 1, 2, 4, 8, 16]
+SYNTHETIC_IMAGES = 10
+SYNTHETIC_SIZE = (720, 1280)
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def synthetic_image(num_boxes, size=SYNTHETIC_SIZE, rng=None):
+    """
+    Noisy background with num_boxes filled ellipses on a grid, so the blobs never overlap. Returns the image and the
+    int xyxy boxes of the blobs.
+    """
+    rng = rng or np.random.default_rng(0)
+    height, width = size
+    img = rng.integers(40, 90, size=(height, width, 3), dtype=np.uint8)
+    img = cv2.GaussianBlur(img, (7, 7), 0)
+
+    cols = max(1, int(np.ceil(np.sqrt(num_boxes))))
+    rows = max(1, int(np.ceil(num_boxes / cols)))
+    cell_w, cell_h = width // cols, height // rows
+
+    boxes = []
+    for k in range(num_boxes):
+        cx = (k % cols) * cell_w + cell_w // 2
+        cy = (k // cols) * cell_h + cell_h // 2
+        ax = int(cell_w * rng.uniform(0.2, 0.4))
+        ay = int(cell_h * rng.uniform(0.15, 0.35))
+        colour = tuple(int(c) for c in rng.integers(120, 255, size=3))
+        cv2.ellipse(img, (cx, cy), (ax, ay), float(rng.uniform(0, 180)), 0, 360, colour, -1)
+        boxes.append([cx - ax, cy - ay, cx + ax, cy + ay])
+
+    boxes = np.clip(np.array(boxes, dtype=int).reshape(-1, 4), 0, [width, height, width, height])
+    return img, boxes
+
+def make_synthetic_set(folder, box_counts=SYNTHETIC_BOXES, images_per_count=SYNTHETIC_IMAGES, seed=0):
+    """
+    Write the synthetic images as JPEGs (so decode is timed like a real image) and return path -> boxes.
+    """
+    rng = np.random.default_rng(seed)
+    boxes = {}
+    for num_boxes in box_counts:
+        for i in range(images_per_count):
+            img, img_boxes = synthetic_image(num_boxes, rng=rng)
+            path = os.path.join(folder, f"synthetic_{num_boxes:02d}_{i:03d}.jpg")
+            cv2.imwrite(path, img)
+            boxes[path] = img_boxes
+    return boxes
+
+def timed(timings, stage, fn, *args, **kwargs):
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    timings[stage] = (time.perf_counter() - start) * 1000
+    return out
+
+def run_image(yolo_model, sam_model, image_path, output_dir, conf=CONF, padding=PADDING, boxes=None, crop=False):
+    """
+    Run one image through the pipeline stage by stage. With boxes given (synthetic mode) they replace the YOLO boxes,
+    with crop FastSAM runs on the box crops (segment_crops).
+    Returns the record of the image: number of detections and the time of every stage in ms.
+    """
+    timings = {}
+    img = timed(timings, "decode", cv2.imread, image_path)
+    if img is None:
+        return None
+
+    yolo_boxes, _, class_ids = timed(timings, "yolo", detect, yolo_model, img, conf=conf)
+    if boxes is not None:
+        yolo_boxes, class_ids = boxes, np.zeros(len(boxes), dtype=int)
+
+    padded, kept = timed(timings, "validate", validate_boxes, yolo_boxes, img.shape, padding)
+    if crop:
+        masks = timed(timings, "fastsam", segment_crops, sam_model, img, padded)
+    else:
+        masks = timed(timings, "fastsam", segment_detections, sam_model, img, padded, img.shape)
+
+    instances = [{"mask": mask, "box": box, "class_id": int(class_ids[i])}
+                 for i, box, mask in zip(kept, padded, masks) if mask is not None]
+    blended = timed(timings, "blend", blend_instances, img, instances)
+
+    name = os.path.splitext(os.path.basename(image_path))[0]
+
+    def write():
+        cv2.imwrite(os.path.join(output_dir, f"{name}.png"), label_map(instances, img.shape))
+        if instances:
+            cv2.imwrite(os.path.join(output_dir, f"segmented_{name}.jpg"), blended)
+    timed(timings, "write", write)
+
+    return {
+        "image": os.path.basename(image_path),
+        "detections": len(padded),
+        "instances": len(instances),
+        "stages_ms": timings,
+        "total_ms": sum(timings.values()),
+    }
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "mean": None}
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50": float(p50), "p95": float(p95), "mean": float(np.mean(values))}
+
+def summarize(records):
+    """
+    p50/p95 of every stage per image, and per detection over the images that had detections.
+    """
+    with_detections = [r for r in records if r["detections"] > 0]
+    summary = {"per_image": {}, "per_detection": {}}
+    for stage in STAGES + ["total"]:
+        values = [r["total_ms"] if stage == "total" else r["stages_ms"][stage] for r in records]
+        summary["per_image"][stage] = percentiles(values)
+        summary["per_detection"][stage] = percentiles(
+            [(r["total_ms"] if stage == "total" else r["stages_ms"][stage]) / r["detections"] for r in with_detections])
+    return summary
+
+def format_table(summary, title):
+    lines = [title, f"{'stage':<10}{'p50 ms':>10}{'p95 ms':>10}{'p50/det':>10}{'p95/det':>10}"]
+    for stage in STAGES + ["total"]:
+        image, det = summary["per_image"][stage], summary["per_detection"][stage]
+        cells = [image["p50"], image["p95"], det["p50"], det["p95"]]
+        lines.append(f"{stage:<10}" + "".join(f"{c:>10.1f}" if c is not None else f"{'-':>10}" for c in cells))
+    return "\n".join(lines)
+
+def benchmark(yolo_model, sam_model, image_dir=None, synthetic=False, box_counts=SYNTHETIC_BOXES,
+              images_per_count=SYNTHETIC_IMAGES, conf=CONF, padding=PADDING, warmup=WARMUP, crop=False, report_path=None):
+    """
+    Replay a folder (or a generated synthetic set) through the pipeline and report the per-stage latencies.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = os.path.join(tmp, "outputs")
+        os.makedirs(output_dir)
+
+        if synthetic:
+            synthetic_boxes = make_synthetic_set(tmp, box_counts, images_per_count)
+            image_paths = sorted(synthetic_boxes)
+        else:
+            synthetic_boxes = {}
+            image_paths = list_images(image_dir)
+
+        # the first images pay for lazy model setup, so they are run but not recorded
+        for image_path in image_paths[:warmup]:
+            run_image(yolo_model, sam_model, image_path, output_dir, conf, padding, synthetic_boxes.get(image_path), crop)
+
+        records = []
+        for image_path in image_paths:
+            record = run_image(yolo_model, sam_model, image_path, output_dir, conf, padding, synthetic_boxes.get(image_path), crop)
+            if record is None:
+                print(f"Warning: Could not read image {image_path}")
+                continue
+            records.append(record)
+
+    report = {
+        "commit": git_commit(),
+        "mode": "synthetic" if synthetic else "folder",
+        "source": None if synthetic else image_dir,
+        "conf": conf,
+        "padding": padding,
+        "crop": crop,
+        "images": len(records),
+        "summary": summarize(records),
+        "records": records,
+    }
+    print(format_table(report["summary"], f"All images ({len(records)})"))
+
+    if synthetic:
+        # one table per box count shows how every stage scales with the detections
+        report["by_boxes"] = {}
+        for num_boxes in box_counts:
+            group = [r for r in records if r["detections"] == num_boxes]
+            if group:
+                report["by_boxes"][str(num_boxes)] = summarize(group)
+                print(format_table(report["by_boxes"][str(num_boxes)], f"{num_boxes} boxes ({len(group)} images)"))
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {report_path}")
+    return report
+
+def mask_iou(a, b):
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 1.0
+
+def crop_agreement(yolo_model, sam_model, image_dir, conf=CONF, padding=PADDING, imgsz=CROP_IMGSZ, warmup=WARMUP,
+                   report_path=None):
+    """
+    Segment the same YOLO boxes with the full-image FastSAM pass and with the crop mode, and report the time of both and
+    the IoU of every pair of masks (a box only one of them could segment counts as IoU 0).
+    """
+    image_paths = list_images(image_dir)
+    full_ms, crop_ms, ious = [], [], []
+
+    for i, image_path in enumerate(image_paths):
+        img = cv2.imread(image_path)
+        if img is None:
+            print(f"Warning: Could not read image {image_path}")
+            continue
+        boxes, _, _ = detect(yolo_model, img, conf=conf)
+        padded, _ = validate_boxes(boxes, img.shape, padding)
+        if not padded:
+            continue
+
+        timings = {}
+        full = timed(timings, "full", segment_detections, sam_model, img, padded, img.shape)
+        cropped = timed(timings, "crop", segment_crops, sam_model, img, padded, imgsz)
+        if i < warmup:
+            continue
+
+        full_ms.append(timings["full"])
+        crop_ms.append(timings["crop"])
+        for a, b in zip(full, cropped):
+            if a is None and b is None:
+                continue
+            ious.append(0.0 if a is None or b is None else mask_iou(a, b))
+
+    report = {
+        "commit": git_commit(),
+        "source": image_dir,
+        "crop_imgsz": imgsz,
+        "images": len(full_ms),
+        "instances": len(ious),
+        "full_ms": percentiles(full_ms),
+        "crop_ms": percentiles(crop_ms),
+        "speedup": sum(full_ms) / sum(crop_ms) if sum(crop_ms) else None,
+        "mask_iou": {**percentiles(ious), "p5": float(np.percentile(ious, 5)) if ious else None,
+                     "above_0.9": float(np.mean(np.array(ious) >= 0.9)) if ious else None},
+    }
+
+    if report["images"]:
+        print(f"Full-image FastSAM p50 {report['full_ms']['p50']:.1f}ms, crop mode at {imgsz} p50 {report['crop_ms']['p50']:.1f}ms "
+              f"- {report['speedup']:.2f}x faster over {report['images']} images")
+    if ious:
+        iou = report["mask_iou"]
+        print(f"Mask IoU crop vs full over {len(ious)} instances: mean {iou['mean']:.3f}, p50 {iou['p50']:.3f}, "
+              f"p5 {iou['p5']:.3f}, {iou['above_0.9'] * 100:.1f}% above 0.9")
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {report_path}")
+    return report
+
+def compare_reports(old_path, new_path):
+    """
+    Print the p50 per image of every stage of two reports side by side (e.g. before and after a change).
+    """
+    with open(old_path, 'r') as f:
+        old = json.load(f)
+    with open(new_path, 'r') as f:
+        new = json.load(f)
+
+    print(f"{'stage':<10}{old.get('commit') or 'old':>12}{new.get('commit') or 'new':>12}{'change':>10}")
+    for stage in STAGES + ["total"]:
+        a, b = old["summary"]["per_image"][stage]["p50"], new["summary"]["per_image"][stage]["p50"]
+        if a is None or b is None:
+            continue
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "-"
+        print(f"{stage:<10}{a:>12.1f}{b:>12.1f}{change:>10}")
+
+if __name__ == "__main__":
+    from ultralytics import FastSAM, YOLO
+
+    yolo_model = YOLO("models/yolo12n_egg_noegg.pt")
+    sam_model = FastSAM("models/FastSAM-s.pt")
+
+    input_dir = r'C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\images'
+
+    benchmark(yolo_model, sam_model, input_dir, report_path="benchmark_pipeline.json")
+    benchmark(yolo_model, sam_model, synthetic=True, report_path="benchmark_pipeline_synthetic.json")
+    crop_agreement(yolo_model, sam_model, input_dir, report_path="benchmark_crop_agreement.json")
@@ -0,0 +1,171 @@
+import os
+import sys
+import random
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocessing_data"))
+from shard_cache import split_images
+from label_cache import open_label_cache
+
+'''Builds the INT8 calibration set for the TFLite exports from the lobster dataset instead of the generic
+calibration_image_sample_data_20x128x128x3_float32.npy (20 images at 128x128). Images are streamed from a data.yaml split,
+sampled evenly across class presence (egg-bearing, undefined, both, none) and lighting (mean brightness bins), and
+preprocessed the way the Ultralytics TFLite export calibrates: letterboxed to imgsz with 114 padding, RGB, float32 in
+0-255. The N x H x W x 3 array is written straight into a memory-mapped .npy, one image at a time.'''
+
+NUM_IMAGES = 200
+IMGSZ = 640
+# mean brightness (0-255) bin edges of the lighting strata
+LIGHTING_BINS = [0, 64, 128, 192, 256]
+SEED = 0
+
+def label_dir_for(image_dir):
+    """
+    Labels folder of an images folder, the same swap of /images/ for /labels/ Ultralytics does.
+    """
+    head, sep, tail = image_dir.rpartition(os.sep + "images")
+    return head + os.sep + "labels" + tail if sep else os.path.join(os.path.dirname(image_dir), "labels")
+
+def brightness(image_path):
+    """
+    Mean brightness of an image, read at 1/8 resolution so the stratification pass stays cheap.
+    """
+    gray = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    return None if gray is None else float(gray.mean())
+
+def letterbox(img, imgsz=IMGSZ, pad_value=114):
+    """
+    Resize keeping the aspect ratio and pad to imgsz x imgsz, centred like the Ultralytics LetterBox.
+    """
+    h, w = img.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    new_w, new_h = round(w * r), round(h * r)
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    return cv2.copyMakeBorder(img, top, imgsz - new_h - top, left, imgsz - new_w - left, cv2.BORDER_CONSTANT,
+                              value=(pad_value, pad_value, pad_value))
+
+def stratify(image_paths):
+    """
+    Group the images by (class presence, lighting bin). Only the paths are kept, nothing is held decoded.
+    """
+    caches = {}
+    strata = defaultdict(list)
+
+    for path in image_paths:
+        image_dir = os.path.dirname(path)
+        if image_dir not in caches:
+            label_dir = label_dir_for(image_dir)
+            caches[image_dir] = open_label_cache(label_dir) if os.path.isdir(label_dir) else None
+
+        cache = caches[image_dir]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        classes = tuple(sorted(set(cache.classes(stem).tolist()))) if cache else ()
+
+        value = brightness(path)
+        if value is None:
+            print(f"Warning: Could not read image {path}")
+            continue
+        lighting = int(np.digitize(value, LIGHTING_BINS[1:-1]))
+        strata[(classes, lighting)].append(path)
+
+    return strata
+
+def sample_evenly(strata, num_images, seed=SEED):
+    """
+    Round-robin over the shuffled strata, so small strata (dark images, rare classes) are represented as well.
+    """
+    rng = random.Random(seed)
+    groups = []
+    for key in sorted(strata):
+        group = list(strata[key])
+        rng.shuffle(group)
+        groups.append(group)
+
+    selected = []
+    while len(selected) < num_images and any(groups):
+        for group in groups:
+            if group and len(selected) < num_images:
+                selected.append(group.pop())
+    return selected
+
+def calibration_name(num_images, imgsz=IMGSZ):
+    return f"calibration_lobster_{num_images}x{imgsz}x{imgsz}x3_float32.npy"
+
+def build_calibration(data_yaml, output_path=None, split="train", num_images=NUM_IMAGES, imgsz=IMGSZ, seed=SEED):
+    """
+    Write the calibration set of a data.yaml split to a memory-mapped float32 .npy of shape (N, imgsz, imgsz, 3).
+    Raises if the split has no images, an empty calibration set would quietly give a broken INT8 model.
+    """
+    image_paths = split_images(data_yaml, split)
+    strata = stratify(image_paths)
+    selected = sample_evenly(strata, num_images, seed)
+    if not selected:
+        raise ValueError(f"No readable images in the {split} split of {data_yaml}, cannot build a calibration set")
+    if len(selected) < num_images:
+        print(f"Warning: Only {len(selected)} of the {num_images} calibration images requested are available")
+
+    for (classes, lighting), paths in sorted(strata.items()):
+        print(f"classes {list(classes) or 'none'}, lighting bin {lighting}: {len(paths)} images")
+
+    output_path = output_path or calibration_name(len(selected), imgsz)
+    calibration = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32,
+                                            shape=(len(selected), imgsz, imgsz, 3))
+    for i, path in enumerate(selected):
+        img = cv2.cvtColor(letterbox(cv2.imread(path), imgsz), cv2.COLOR_BGR2RGB)
+        calibration[i] = img.astype(np.float32)
+
+    calibration.flush()
+    del calibration
+    print(f"Saved {len(selected)} calibration images to {output_path}")
+    return output_path
+
+def ensure_calibration(data_yaml, split="train", num_images=NUM_IMAGES, imgsz=IMGSZ, seed=SEED):
+    """
+    Path of the calibration file of num_images images, reused if it already exists with that many images, built otherwise.
+    """
+    path = calibration_name(num_images, imgsz)
+    if os.path.exists(path):
+        found = np.load(path, mmap_mode='r').shape[0]
+        if found == num_images:
+            return path
+        print(f"{path} holds {found} images instead of {num_images}, rebuilding it")
+        os.remove(path)
+    return build_calibration(data_yaml, None, split, num_images, imgsz, seed)
+
+def export_int8_tflite(model, calibration_path, imgsz=IMGSZ):
+    """
+    Full-integer TFLite export of an Ultralytics model calibrated on a calibration .npy: ONNX export, then onnx2tf with
+    the calibration data (normalised by 255, like the Ultralytics int8 export). The .tflite files go to <name>_saved_model.
+    """
+    calibration = np.load(calibration_path, mmap_mode='r')
+    if calibration.ndim != 4 or calibration.shape[0] == 0 or calibration.shape[1:3] != (imgsz, imgsz):
+        raise ValueError(f"Calibration data {calibration_path} has shape {calibration.shape}, expected (N, {imgsz}, {imgsz}, 3)")
+    del calibration
+
+    import onnx2tf
+
+    onnx_path = model.export(format="onnx", imgsz=imgsz)
+    output_dir = os.path.splitext(onnx_path)[0] + "_saved_model"
+    onnx2tf.convert(
+        input_onnx_file_path=onnx_path,
+        output_folder_path=output_dir,
+        not_use_onnxsim=True,
+        verbosity="error",
+        output_integer_quantized_tflite=True,
+        quant_type="per-tensor",
+        custom_input_op_name_np_data_path=[["images", calibration_path, [[[[0, 0, 0]]]], [[[[255, 255, 255]]]]]],
+        disable_group_convolution=True,
+        enable_batchmatmul_unfold=True,
+    )
+    print(f"INT8 TFLite export saved to {output_dir}")
+    return output_dir
+
+if __name__ == "__main__":
+    build_calibration(os.path.join("..", "data.yaml"))
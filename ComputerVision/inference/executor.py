@@ -0,0 +1,161 @@
+import os
+import sys
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from profiling import profiler
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def list_images(folder, extensions=IMAGE_EXTENSIONS):
+    """
+    Sorted paths of the images in a folder.
+    """
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.lower().endswith(extensions)]
+
+
+def write_image(output_path, image):
+    """
+    Encode and write one output image, returns False if OpenCV could not write it.
+    """
+    ok = cv2.imwrite(output_path, image)
+    if not ok:
+        print(f"Error writing {output_path}")
+    return ok
+
+
+class StreamingExecutor:
+    """
+    Producer/consumer loop for folder inference. A thread pool reads and decodes the upcoming images into a bounded queue,
+    the model runs on the calling thread, and another thread pool encodes and writes the outputs, so disk I/O and JPEG
+    coding overlap with inference instead of running one after another.
+    """
+
+    def __init__(self, queue_depth=8, decode_workers=2, write_workers=2, decode=cv2.imread, write=write_image):
+        self.queue_depth = queue_depth
+        self.decode_workers = decode_workers
+        self.write_workers = write_workers
+        self.decode = decode
+        self.write = write
+
+    def _decode(self, image_path):
+        with profiler.span("decode", image=os.path.basename(image_path)):
+            return self.decode(image_path)
+
+    def _write(self, output_path, image):
+        with profiler.span("write", output=os.path.basename(output_path)):
+            return self.write(output_path, image)
+
+    def _produce(self, image_paths, decode_pool, pending, stop):
+        # the queue is bounded, so we never decode more than queue_depth images ahead of the model
+        for image_path in image_paths:
+            if stop.is_set():
+                break
+            pending.put((image_path, decode_pool.submit(self._decode, image_path)))
+        pending.put(None)
+
+    def run(self, image_paths, process, batch_size=None, done=None):
+        """
+        Run process(image_path, frame) over all images in order. process returns a list of (output_path, image) pairs to
+        write (or None). With batch_size set, process(image_paths, frames) gets lists of up to batch_size prefetched
+        frames instead. done(image_paths), if given, is called (from a write thread) once all outputs of a process call
+        were written, never for a call that returned None or had a failed write. Returns the throughput stats of the run.
+        """
+        pending = queue.Queue(maxsize=self.queue_depth)
+        write_slots = threading.BoundedSemaphore(self.queue_depth)
+        stop = threading.Event()
+        counts = {"processed": 0, "failed": 0, "written": 0}
+        counts_lock = threading.Lock()
+
+        def written(future, paths, call):
+            try:
+                ok = future.exception() is None and bool(future.result())
+                if future.exception() is not None:
+                    print(f"Error writing output: {future.exception()}")
+                with counts_lock:
+                    counts["written"] += ok
+                    call["remaining"] -= 1
+                    call["ok"] = call["ok"] and ok
+                    finished = call["remaining"] == 0 and call["ok"]
+                if finished and done:
+                    done(paths)
+            finally:
+                write_slots.release()
+
+        def dispatch(paths, frames):
+            outputs = process(paths[0], frames[0]) if batch_size is None else process(paths, frames)
+            counts["processed"] += len(paths)
+            profiler.count("images", len(paths))
+            if outputs is None:
+                return
+
+            outputs = list(outputs)
+            if not outputs and done:
+                done(paths)
+            # writes of this call still in flight, done fires after the last one
+            call = {"remaining": len(outputs), "ok": True}
+            for output_path, image in outputs:
+                # block when queue_depth writes are in flight so finished frames do not pile up in memory
+                write_slots.acquire()
+                future = write_pool.submit(self._write, output_path, image)
+                future.add_done_callback(lambda f, paths=paths, call=call: written(f, paths, call))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.decode_workers, thread_name_prefix="decode") as decode_pool, \
+                ThreadPoolExecutor(self.write_workers, thread_name_prefix="write") as write_pool:
+            producer = threading.Thread(target=self._produce, args=(image_paths, decode_pool, pending, stop), daemon=True)
+            producer.start()
+
+            batch_paths, batch_frames = [], []
+            try:
+                while True:
+                    item = pending.get()
+                    if item is None:
+                        break
+
+                    image_path, decoded = item
+                    # time the model thread spends waiting on the decode threads
+                    with profiler.span("wait_decode"):
+                        frame = decoded.result()
+                    if frame is None:
+                        print(f"Error loading image: {image_path}")
+                        counts["failed"] += 1
+                        profiler.count("failed_images")
+                        continue
+
+                    batch_paths.append(image_path)
+                    batch_frames.append(frame)
+                    if len(batch_paths) == (batch_size or 1):
+                        dispatch(batch_paths, batch_frames)
+                        batch_paths, batch_frames = [], []
+
+                if batch_paths:
+                    dispatch(batch_paths, batch_frames)
+            finally:
+                # unblock the producer if process raised halfway through the folder
+                stop.set()
+                while producer.is_alive():
+                    try:
+                        pending.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+
+        processed, failed, written = counts["processed"], counts["failed"], counts["written"]
+        elapsed = time.perf_counter() - start
+
+        stats = {
+            "images": processed,
+            "failed": failed,
+            "written": written,
+            "seconds": elapsed,
+            "images_per_sec": processed / elapsed if elapsed > 0 else 0.0,
+        }
+        print(f"Processed {processed} images ({failed} failed, {written} outputs written) in {elapsed:.2f}s - "
+              f"{stats['images_per_sec']:.2f} images/sec")
+        return stats
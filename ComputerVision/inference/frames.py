@@ -0,0 +1,31 @@
+class FrameBuffer:
+    """
+    Holds the frame (BGR) decoded once by the prefetch threads of the StreamingExecutor or the video reader and hands the same
+    numpy array to every stage of the pipeline: detection, segmentation and blending.
+    Every stage that receives the buffered array instead of the file path is one JPEG decode saved.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.frame = None
+        self.decoded = 0
+        self.decodes_saved = 0
+
+    def put(self, frame, path=None):
+        """
+        Buffer a frame decoded by another stage, e.g. the prefetch threads of the StreamingExecutor.
+        """
+        self.frame = frame
+        self.path = path
+        self.decoded += 1
+        return self.frame
+
+    def share(self):
+        """
+        Give the buffered frame to the next stage instead of letting it decode the file again.
+        """
+        self.decodes_saved += 1
+        return self.frame
+
+    def report(self):
+        print(f"Decoded {self.decoded} images, saved {self.decodes_saved} decodes by sharing frames between stages")
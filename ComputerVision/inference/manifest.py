@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+'''Incremental mode for runinference.py and sam2seg.py. A JSONL manifest in the output folder records, for every image that
+was fully processed, the sha1 of its content (with its mtime and size, so unchanged files are not hashed again). The first
+line holds the sha1 of the model weights and the inference parameters (conf, padding, ...); when either changes, the
+manifest starts over and every image is processed again. Entries are only appended after all outputs of an image were
+written, so an interrupted run resumes at the first image that was not finished, and a line cut off by a crash is ignored.
+An image whose required outputs were deleted is processed again as well.'''
+
+MANIFEST_NAME = ".inference_manifest.jsonl"
+CHUNK_SIZE = 1 << 20
+
+def file_hash(path):
+    """
+    sha1 of a file, read in chunks so large weights or 4K images are not loaded whole.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+class InferenceManifest:
+    """
+    Tracks which images of a folder are up to date for one set of weights and parameters.
+    """
+
+    def __init__(self, output_dir, weights, params, required_outputs=None, name=MANIFEST_NAME):
+        """
+        required_outputs(image_path) gives the output files that must exist for an image to count as done.
+        """
+        self.path = os.path.join(output_dir, name)
+        self.required_outputs = required_outputs or (lambda image_path: [])
+        # the weights are identified by content, a retrained model saved under the same name still invalidates the outputs
+        self.header = {
+            "weights": {os.path.basename(w): file_hash(w) for w in (weights if isinstance(weights, (list, tuple)) else [weights])},
+            "params": params,
+        }
+        self.entries = {}
+        self.hashes = {}
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                header = json.loads(f.readline() or "{}")
+                if header == self.header:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:  # last line cut off by a crash
+                            continue
+                        self.entries[entry["image"]] = entry
+                else:
+                    print("Model weights or inference parameters changed, starting a new manifest")
+
+        if not self.entries:
+            with open(self.path, 'w') as f:
+                f.write(json.dumps(self.header) + '\n')
+        self.file = open(self.path, 'a')
+
+    def _content_hash(self, image_path):
+        # mtime and size match the manifest -> trust the recorded hash instead of reading the image again
+        stat = os.stat(image_path)
+        entry = self.entries.get(os.path.basename(image_path))
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["sha1"], stat
+        return file_hash(image_path), stat
+
+    def is_done(self, image_path):
+        entry = self.entries.get(os.path.basename(image_path))
+        if entry is None:
+            return False
+        sha1, stat = self._content_hash(image_path)
+        self.hashes[image_path] = (sha1, stat)
+        return sha1 == entry["sha1"] and all(os.path.exists(p) for p in self.required_outputs(image_path))
+
+    def pending(self, image_paths, workers=8):
+        """
+        The images that still have to be processed: new, changed, or with outputs that are missing.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            done = list(pool.map(self.is_done, image_paths))
+        todo = [p for p, d in zip(image_paths, done) if not d]
+        print(f"Incremental run: {len(image_paths) - len(todo)} images up to date, {len(todo)} to process")
+        return todo
+
+    def add(self, image_paths):
+        """
+        Record the images as done, called by the executor after their outputs were written.
+        """
+        for image_path in image_paths:
+            cached = self.hashes.get(image_path)
+            sha1, stat = cached if cached else self._content_hash(image_path)
+            entry = {"image": os.path.basename(image_path), "sha1": sha1, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            with self.lock:
+                self.entries[entry["image"]] = entry
+                self.file.write(json.dumps(entry) + '\n')
+                self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,154 @@
+import os
+import json
+import base64
+import threading
+
+import cv2
+import numpy as np
+
+'''Compact instance-mask output of sam2seg.py. Instead of a blended JPEG per image, every image becomes one JSON line in an
+appendable .masks.jsonl file per run:
+
+    {"image": "img1.jpg", "height": 2160, "width": 3840,
+     "instances": [{"box": [x1, y1, x2, y2], "class_id": 0, "confidence": 0.91,
+                    "mask_box": [x1, y1, x2, y2], "encoding": "rle", "data": "<base64>"}]}
+
+Only the tight box around each mask is stored, either run-length encoded (row-major run lengths starting with a 0 run,
+as uint32) or bit-packed (np.packbits), base64 encoded. Masks are decoded back exactly, so the evaluation can read them
+directly, and the overlays are only rendered when asked for (render_overlays). Lines are flushed one by one; a line cut
+off by a crash is skipped when reading, and when an image appears more than once (a re-run) the last line wins.'''
+
+ENCODING = "rle"
+
+def encode_mask(mask, encoding=ENCODING):
+    """
+    Encode the tight box of a full-frame boolean mask. Returns the mask box, the encoding and the base64 data.
+    """
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if len(rows) == 0:
+        return {"mask_box": [0, 0, 0, 0], "encoding": encoding, "data": ""}
+    y1, y2, x1, x2 = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+    crop = mask[y1:y2, x1:x2].ravel()
+
+    if encoding == "rle":
+        # positions where the value flips, the runs alternate 0s and 1s starting with 0s
+        flips = np.flatnonzero(crop[1:] != crop[:-1]) + 1
+        bounds = np.concatenate([[0], flips, [crop.size]])
+        runs = np.diff(bounds)
+        if crop[0]:
+            runs = np.concatenate([[0], runs])
+        payload = runs.astype('<u4').tobytes()
+    elif encoding == "bits":
+        payload = np.packbits(crop).tobytes()
+    else:
+        raise ValueError(f"Unknown mask encoding {encoding}, use 'rle' or 'bits'")
+
+    return {"mask_box": [x1, y1, x2, y2], "encoding": encoding, "data": base64.b64encode(payload).decode("ascii")}
+
+def decode_mask(entry, height, width):
+    """
+    Full-frame boolean mask of an encoded instance.
+    """
+    mask = np.zeros((height, width), dtype=bool)
+    x1, y1, x2, y2 = entry["mask_box"]
+    size = (y2 - y1) * (x2 - x1)
+    if size == 0:
+        return mask
+
+    payload = base64.b64decode(entry["data"])
+    if entry["encoding"] == "rle":
+        runs = np.frombuffer(payload, dtype='<u4')
+        values = np.arange(len(runs)) % 2 == 1
+        crop = np.repeat(values, runs)
+    elif entry["encoding"] == "bits":
+        crop = np.unpackbits(np.frombuffer(payload, dtype=np.uint8), count=size).astype(bool)
+    else:
+        raise ValueError(f"Unknown mask encoding {entry['encoding']}")
+
+    mask[y1:y2, x1:x2] = crop.reshape(y2 - y1, x2 - x1)
+    return mask
+
+class MaskWriter:
+    """
+    Appends one line per image to the run's mask file. Safe to call from the executor threads. Instances either carry
+    their boolean "mask" or are already encoded (mask_box, encoding, data from encode_mask).
+    """
+
+    def __init__(self, path, encoding=ENCODING):
+        self.path = path
+        self.encoding = encoding
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def write(self, image_name, img_shape, instances):
+        record = {
+            "image": image_name,
+            "height": int(img_shape[0]),
+            "width": int(img_shape[1]),
+            "instances": [{"box": [int(v) for v in instance["box"]],
+                           "class_id": int(instance["class_id"]),
+                           "confidence": float(instance["confidence"]),
+                           **(encode_mask(instance["mask"], self.encoding) if "mask" in instance else
+                              {key: instance[key] for key in ("mask_box", "encoding", "data")})} for instance in instances],
+        }
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def read_records(path):
+    """
+    image name -> record of a mask file, the last line of an image wins.
+    """
+    records = {}
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:  # last line cut off by a crash
+                continue
+            records[record["image"]] = record
+    return records
+
+def decode_instances(record):
+    """
+    Instances of a record in the sam2seg format (mask, box, class id, confidence), ready for blend_instances/label_map.
+    """
+    return [{"mask": decode_mask(entry, record["height"], record["width"]), "box": entry["box"],
+             "class_id": entry["class_id"], "confidence": entry["confidence"]} for entry in record["instances"]]
+
+def export_label_maps(mask_path, output_dir):
+    """
+    Write the class label map png of every record (0 - background, class id + 1), the input of evaluation_seg/label_eval.py.
+    """
+    from sam2seg import label_map
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name, record in read_records(mask_path).items():
+        labels = label_map(decode_instances(record), (record["height"], record["width"]))
+        cv2.imwrite(os.path.join(output_dir, os.path.splitext(name)[0] + ".png"), labels)
+
+def render_overlays(mask_path, image_dir, output_dir, images=None):
+    """
+    Render the blended overlays of a mask file, for all images or only the given image names.
+    """
+    from sam2seg import blend_instances
+
+    os.makedirs(output_dir, exist_ok=True)
+    records = read_records(mask_path)
+    for name in images or sorted(records):
+        record = records.get(name)
+        img = cv2.imread(os.path.join(image_dir, name))
+        if record is None or img is None:
+            print(f"Warning: No mask record or image for {name}")
+            continue
+        cv2.imwrite(os.path.join(output_dir, f"segmented_{name}"), blend_instances(img, decode_instances(record)))
+
+if __name__ == "__main__":
+    image_dir = r'C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\images'
+
+    render_overlays("runs/fastsam/fastsam.masks.jsonl", image_dir, "runs/fastsam")
+    export_label_maps("runs/fastsam/fastsam.masks.jsonl", "runs/fastsam_labels")
@@ -0,0 +1,115 @@
+import os
+import sys
+
+import numpy as np
+
+from executor import StreamingExecutor, list_images
+from mask_store import MaskWriter, encode_mask
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shard_cache import split_images
+
+'''Raw-prediction cache for tuning the confidence thresholds offline. The model runs once over a folder or a data.yaml
+split at a very low confidence floor and every box, score and class is kept in one .npz:
+
+    names (M), heights (M), widths (M)    image file names and sizes
+    offsets (M + 1)                       image j owns predictions offsets[j]:offsets[j + 1]
+    boxes (N, 4) float32 xyxy pixels, scores (N) float32, classes (N) int32
+
+With save_masks (segmentation models) the instance masks go to <name>.masks.jsonl next to it, in the mask_store.py format.
+Only the masks of the top MASK_MAX_DET predictions scoring at least MASK_CONF are kept (the lowest threshold of the mask
+sweep), copied off the device and encoded a few at a time; the boxes still go down to the floor.
+evaluation_seg/threshold_sweep.py re-thresholds the cache against the labels, so choosing conf needs no new inference.'''
+
+CONF_FLOOR = 0.001
+MAX_DET = 1000
+BATCH_SIZE = 16
+# full-resolution masks are kept for far fewer predictions than the boxes, a 4K mask is 8 MB as bool
+MASK_MAX_DET = 100
+MASK_CONF = 0.05
+MASK_CHUNK = 16
+
+def top_masks(result, boxes, scores, classes, mask_max_det=MASK_MAX_DET, mask_conf=MASK_CONF, chunk=MASK_CHUNK):
+    """
+    Encoded instances of the highest scoring predictions above mask_conf, at most mask_max_det. The masks are indexed on
+    the device, copied to the CPU and encoded in chunks, so only a few full-resolution masks are ever on the host at once.
+    """
+    if result.masks is None:
+        return []
+    keep = np.flatnonzero(scores >= mask_conf)
+    keep = keep[np.argsort(-scores[keep], kind="stable")][:mask_max_det]
+
+    instances = []
+    for start in range(0, len(keep), chunk):
+        indices = keep[start:start + chunk]
+        masks = result.masks.data[indices.tolist()].cpu().numpy() > 0.5
+        instances.extend({"box": boxes[i], "class_id": classes[i], "confidence": scores[i], **encode_mask(mask)}
+                         for i, mask in zip(indices, masks))
+    return instances
+
+def cache_predictions(model, image_paths, output_path, conf_floor=CONF_FLOOR, imgsz=640, batch_size=BATCH_SIZE,
+                      save_masks=False, max_det=MAX_DET, mask_max_det=MASK_MAX_DET, mask_conf=MASK_CONF):
+    """
+    Run the model once over the images at conf_floor and save all predictions to output_path (.npz).
+    """
+    names, heights, widths, counts = [], [], [], []
+    boxes, scores, classes = [], [], []
+    mask_writer = MaskWriter(os.path.splitext(output_path)[0] + ".masks.jsonl") if save_masks else None
+
+    def process(paths, frames):
+        # retina_masks gives the masks at the original image size, the same size the labels are rasterized at
+        results = model(source=frames, conf=conf_floor, imgsz=imgsz, max_det=max_det, retina_masks=save_masks,
+                        stream=True, verbose=False)
+        for path, frame, result in zip(paths, frames, results):
+            names.append(os.path.basename(path))
+            heights.append(frame.shape[0])
+            widths.append(frame.shape[1])
+            counts.append(len(result.boxes))
+            boxes.append(result.boxes.xyxy.cpu().numpy().astype(np.float32).reshape(-1, 4))
+            scores.append(result.boxes.conf.cpu().numpy().astype(np.float32))
+            classes.append(result.boxes.cls.cpu().numpy().astype(np.int32))
+
+            if mask_writer:
+                mask_writer.write(names[-1], frame.shape, top_masks(result, boxes[-1], scores[-1], classes[-1],
+                                                                   mask_max_det, mask_conf))
+        return []
+
+    executor = StreamingExecutor(queue_depth=max(8, batch_size))
+    try:
+        executor.run(image_paths, process, batch_size=batch_size)
+    finally:
+        if mask_writer:
+            mask_writer.close()
+
+    np.savez(
+        output_path,
+        names=np.array(names),
+        heights=np.array(heights, dtype=np.int32),
+        widths=np.array(widths, dtype=np.int32),
+        offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        boxes=np.concatenate(boxes) if boxes else np.zeros((0, 4), dtype=np.float32),
+        scores=np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32),
+        classes=np.concatenate(classes) if classes else np.zeros(0, dtype=np.int32),
+        conf_floor=conf_floor,
+    )
+    print(f"Cached {sum(counts)} predictions of {len(names)} images at conf >= {conf_floor} in {output_path}")
+    return output_path
+
+def load_predictions(path):
+    """
+    The arrays of a prediction cache as a dict.
+    """
+    with np.load(path) as cache:
+        return {key: cache[key] for key in cache.files}
+
+if __name__ == "__main__":
+    from ultralytics import YOLO
+
+    # detection model of runinference.py/sam2seg.py on the test split
+    cache_predictions(YOLO("models/yolo12n_egg_noegg.pt"), split_images(os.path.join("..", "data.yaml"), "test"),
+                      "predictions_yolo12n_test.npz")
+
+    # segmentation model, with its masks for the IoU/Dice sweep
+    image_dir = r'C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\images'
+    cache_predictions(YOLO(os.path.join("..", "evaluation_seg", "YOLO11-seg", "yolo11n-egg_noeggseg.pt")),
+                      list_images(image_dir), "predictions_yolo11seg_segGT.npz", save_masks=True)
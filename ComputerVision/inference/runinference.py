@@ -1,29 +1,100 @@
 import os
+import sys
 from ultralytics import YOLO
 
+from executor import StreamingExecutor, list_images
+from manifest import InferenceManifest
+from tiling import detect_tiled_batch, draw_boxes
 
-model = YOLO('yolo12n_egg_noegg.pt')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from profiling import profiler
 
-source_folder = r'C:\Users\dorot\Desktop\Dissertation2025\MobileDevelopment\LobsterDataset2025\Aquaseg_Lobster_Dataset\tryinf' 
+
+weights = 'yolo12n_egg_noegg.pt'
+model = YOLO(weights)
+
+source_folder = r'C:\Users\dorot\Desktop\Dissertation2025\MobileDevelopment\LobsterDataset2025\Aquaseg_Lobster_Dataset\tryinf'
 
 output_folder = 'yolo12outputboxes'
 
 os.makedirs(output_folder, exist_ok=True)
 
+# prefetch/write settings for the streaming executor
+QUEUE_DEPTH = 8
+DECODE_WORKERS = 2
+WRITE_WORKERS = 2
+
+# images per YOLO forward pass, 1 runs every image on its own like before
+BATCH_SIZE = 16
+
+CONF = 0.9
+
+# tiled detection for the 4K+ tray photos: overlapping TILE_SIZE tiles, TILE_BATCH tiles per forward pass
+TILED = False
+TILE_SIZE = 640
+TILE_OVERLAP = 128
+TILE_BATCH = 16
+
+# only process images that are new or changed since the last run with the same weights, conf and tiling
+INCREMENTAL = True
+
+
+def process(image_paths, frames):
+    """
+    Run YOLO on a batch of prefetched frames in one forward pass and hand the annotated images to the write threads.
+    """
+    if TILED:
+        return process_tiled(image_paths, frames)
+
+    # stream=True gives the results back one image at a time, so memory stays flat however large the folder is
+    results = model(
+        source=frames,
+        conf=CONF,
+        stream=True,
+        show=False,
+        verbose=False
+    )
+
+    outputs = []
+    with profiler.span("yolo_batch", images=len(frames)):
+        # the results are generated lazily, so the forward pass runs inside this loop
+        for image_path, result in zip(image_paths, results):
+            profiler.count("detections", len(result.boxes))
+            with profiler.span("plot"):
+                annotated = result.plot(labels=True, conf=True)
+            output_path = os.path.join(output_folder, os.path.basename(image_path))
+            outputs.append((output_path, annotated))
+    return outputs
+
+
+def process_tiled(image_paths, frames):
+    """
+    Tiled variant of process: the tiles of the whole batch share the forward passes, boxes are merged across the seams.
+    """
+    outputs = []
+    with profiler.span("yolo_tiled_batch", images=len(frames)):
+        detections = detect_tiled_batch(model, frames, conf=CONF, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH)
+    for image_path, frame, (boxes, confidences, class_ids) in zip(image_paths, frames, detections):
+        profiler.count("detections", len(boxes))
+        output_path = os.path.join(output_folder, os.path.basename(image_path))
+        outputs.append((output_path, draw_boxes(frame, boxes, confidences, class_ids, model.names)))
+    return outputs
+
+
+image_paths = list_images(source_folder)
+manifest = None
+if INCREMENTAL:
+    params = {"conf": CONF, "tiling": [TILE_SIZE, TILE_OVERLAP] if TILED else None}
+    manifest = InferenceManifest(output_folder, weights, params,
+                                 required_outputs=lambda image_path: [os.path.join(output_folder, os.path.basename(image_path))])
+    image_paths = manifest.pending(image_paths)
 
-for image_name in os.listdir(source_folder):
-    if image_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-        image_path = os.path.join(source_folder, image_name)
-        
-       
-        results = model(
-            source=image_path, 
-            conf=0.9, 
-            save=True,  
-            save_dir=output_folder,
-            show=False, 
-            show_labels=True,
-            show_conf=True
-        )
+executor = StreamingExecutor(queue_depth=max(QUEUE_DEPTH, BATCH_SIZE), decode_workers=DECODE_WORKERS, write_workers=WRITE_WORKERS)
+try:
+    executor.run(image_paths, process, batch_size=BATCH_SIZE, done=manifest.add if manifest else None)
+finally:
+    if manifest:
+        manifest.close()
 
 print("Inference complete. Results saved to:", output_folder)
+profiler.export("runinference")
@@ -1,90 +1,298 @@
 import os
+import sys
 import torch
 from ultralytics import FastSAM,YOLO
 import cv2
 import numpy as np
 
-# load the yolo model first
-yolo_model = YOLO("models/yolo12n_egg_noegg.pt")
-sam_model = FastSAM("models/FastSAM-s.pt")
+from executor import StreamingExecutor, list_images
+from frames import FrameBuffer
+from manifest import InferenceManifest
+from tiling import detect_tiled
+from mask_store import MaskWriter
 
-input_dir = r'C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\images'
-output_dir = "runs/fastsam"
-os.makedirs(output_dir, exist_ok=True)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from profiling import profiler
 
-# extract class name from yolo
-class_names = yolo_model.model.names
+# we add a small padding for the sam model predictions
+PADDING = 5
+ALPHA = 0.5
+CONF = 0.7
+# crop mode: FastSAM inference size for one padded box, and the extra context around the box (fraction of its size)
+CROP_IMGSZ = 320
+CROP_CONTEXT = 0.1
 
-for filename in os.listdir(input_dir):
-    if filename.lower().endswith((".jpg", ".png", ".jpeg")):
-        # load image
-        image_path = os.path.join(input_dir, filename)
-        img = cv2.imread(image_path)
 
-        if img is None:
-            print(f"Error loading image: {image_path}")
+def class_colour(class_id):
+    """
+    Overlay colour (BGR) for a YOLO class id.
+    """
+    if class_id == 1:  # Egg-bearing lobster
+        return [0, 0, 255]  # Blue for egg-bearing lobsters
+    return [255, 0, 0]  # Red for the generic lobster
+
+
+def detect(yolo_model, source, conf=CONF):
+    """
+    Run YOLO on one image and return the boxes (int xyxy), confidences and class ids as numpy arrays.
+    """
+    yolo_results = yolo_model(source, conf=conf)
+    boxes = yolo_results[0].boxes
+
+    if not boxes or len(boxes.xyxy) == 0:
+        return np.zeros((0, 4), dtype=int), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=int)
+
+    return (boxes.xyxy.cpu().numpy().astype(int),
+            boxes.conf.cpu().numpy().astype(np.float32),
+            boxes.cls.cpu().numpy().astype(int))
+
+
+def validate_boxes(boxes, img_shape, padding=PADDING):
+    """
+    Drop invalid bounding boxes and pad the rest for the sam model. Returns the padded boxes and the indices of the detections that were kept.
+    """
+    height, width = img_shape[:2]
+    padded, kept = [], []
+
+    for i, (x1, y1, x2, y2) in enumerate(np.asarray(boxes, dtype=int).tolist()):
+        if x1 >= x2 or y1 >= y2 or x1 < 0 or y1 < 0 or x2 > width or y2 > height:
+            print(f"Invalid bounding box: [{x1},{y1},{x2},{y2}] - skipping")
             continue
 
-        try:
-            yolo_results = yolo_model(image_path, conf=0.7)
+        padded.append([max(0, x1 - padding), max(0, y1 - padding),
+                       min(width, x2 + padding), min(height, y2 + padding)])
+        kept.append(i)
 
-            if not yolo_results[0].boxes or len(yolo_results[0].boxes.xyxy) == 0:
-                print(f"No lobsters detected in {filename}")
-                continue
+    return padded, kept
 
-            for i, (box, conf, cls) in enumerate(zip(yolo_results[0].boxes.xyxy, yolo_results[0].boxes.conf, yolo_results[0].boxes.cls)):
-                x1, y1, x2, y2 = map(int, box.cpu().numpy())
-                confidence = float(conf.cpu().item())
-                class_id = int(cls.cpu().item())
 
-              
-                print(f"YOLO detected class ID: {class_id} with confidence {confidence:.2f} at [{x1},{y1},{x2},{y2}]")
+def assign_masks_to_boxes(masks, boxes):
+    """
+    For every box pick the mask that best fits it (mask area inside the box over the union of box and mask), the same rule FastSAM uses for box prompts.
+    """
+    mask_areas = masks.reshape(len(masks), -1).sum(axis=1)
+    assigned = []
 
-                #we validate the bounding boxes
-                if x1 >= x2 or y1 >= y2 or x1 < 0 or y1 < 0 or x2 > img.shape[1] or y2 > img.shape[0]:
-                    print(f"Invalid bounding box: [{x1},{y1},{x2},{y2}] - skipping")
-                    continue
+    for x1, y1, x2, y2 in boxes:
+        box_area = (x2 - x1) * (y2 - y1)
+        inside = masks[:, y1:y2, x1:x2].reshape(len(masks), -1).sum(axis=1)
+        union = box_area + mask_areas - inside
+        assigned.append(int(np.argmax(inside / np.maximum(union, 1))))
 
-                # we add a small padding for the sam model predictions
-                padding = 5
-                x1 = max(0, x1 - padding)
-                y1 = max(0, y1 - padding)
-                x2 = min(img.shape[1], x2 + padding)
-                y2 = min(img.shape[0], y2 + padding)
+    return assigned
 
-                # we run sam-variant model
-                try:
-                    sam_results = sam_model(image_path, bboxes=[[x1, y1, x2, y2]])
 
-                    if not hasattr(sam_results[0], "masks") or sam_results[0].masks is None or len(sam_results[0].masks) == 0:
-                        print(f"SAM did not generate masks for detection {i} in {filename}")
-                        continue
+def segment_detections(sam_model, source, boxes, img_shape):
+    """
+    Segment all boxes of one image with a single FastSAM call and split the masks back out per box. Returns one boolean mask (or None) per box.
+    """
+    if len(boxes) == 0:
+        return []
 
-                    # get the segmentation masks
-                    mask = sam_results[0].masks.data[0].cpu().numpy()
+    sam_results = sam_model(source, bboxes=[list(b) for b in boxes])
 
-                
-                    overlay = np.zeros_like(img, dtype=np.uint8)
+    if not hasattr(sam_results[0], "masks") or sam_results[0].masks is None or len(sam_results[0].masks) == 0:
+        return [None] * len(boxes)
 
-                  
-                    if class_id == 1:  # Egg-bearing lobster
-                        overlay[mask > 0.5] = [0, 0, 255]  # Blue for egg-bearing lobsters
-                    else:  # Undefined 
-                        overlay[mask > 0.5] = [255, 0, 0]  # Red for the generic lobster
+    masks = sam_results[0].masks.data.cpu().numpy() > 0.5
 
-                    
-                    alpha = 0.5  
-                    blended_img = cv2.addWeighted(img, 1, overlay, alpha, 0)
+    # masks can come back at the inference size, so we scale them to the image
+    height, width = img_shape[:2]
+    if masks.shape[1:] != (height, width):
+        masks = np.stack([cv2.resize(m.astype(np.uint8), (width, height), interpolation=cv2.INTER_NEAREST)
+                          for m in masks]).astype(bool)
 
-                    # save the blended image
-                    mask_output_path = os.path.join(output_dir, f"segmented_{filename}")
-                    cv2.imwrite(mask_output_path, blended_img)
+    return [masks[j] for j in assign_masks_to_boxes(masks, boxes)]
 
-                    print(f"Processed {filename} and saved segmentation overlay: {mask_output_path}")
 
-                except Exception as e:
-                    print(f"Error processing detection {i} in {filename} with SAM: {e}")
+def segment_crops(sam_model, img, boxes, imgsz=CROP_IMGSZ, context=CROP_CONTEXT):
+    """
+    Segment every box on its own crop instead of the full image: FastSAM runs at a small inference size on the padded box
+    plus a little context, and the mask is pasted back into full-frame coordinates. Returns one boolean mask (or None) per box.
+    """
+    height, width = img.shape[:2]
+    masks = []
 
-        except Exception as e:
-            print(f"Error processing {filename} with YOLO: {e}")
+    for x1, y1, x2, y2 in boxes:
+        mx, my = int((x2 - x1) * context), int((y2 - y1) * context)
+        cx1, cy1, cx2, cy2 = max(0, x1 - mx), max(0, y1 - my), min(width, x2 + mx), min(height, y2 + my)
+        crop = img[cy1:cy2, cx1:cx2]
+        crop_box = [x1 - cx1, y1 - cy1, x2 - cx1, y2 - cy1]
+
+        sam_results = sam_model(crop, bboxes=[crop_box], imgsz=imgsz, verbose=False)
+        if not hasattr(sam_results[0], "masks") or sam_results[0].masks is None or len(sam_results[0].masks) == 0:
+            masks.append(None)
+            continue
+
+        crop_masks = sam_results[0].masks.data.cpu().numpy() > 0.5
+        if crop_masks.shape[1:] != crop.shape[:2]:
+            crop_masks = np.stack([cv2.resize(m.astype(np.uint8), (crop.shape[1], crop.shape[0]), interpolation=cv2.INTER_NEAREST)
+                                   for m in crop_masks]).astype(bool)
+
+        mask = np.zeros((height, width), dtype=bool)
+        mask[cy1:cy2, cx1:cx2] = crop_masks[assign_masks_to_boxes(crop_masks, [crop_box])[0]]
+        masks.append(mask)
+
+    return masks
+
+
+def segment_image(yolo_model, sam_model, frames, conf=CONF, padding=PADDING, tiling=None, crop=False):
+    """
+    Detect lobsters and segment them with one FastSAM pass. Both models get the decoded frame from the FrameBuffer instead of the file path.
+    With tiling (detect_tiled settings, e.g. {"tile_size": 640, "overlap": 128, "batch_size": 8}) YOLO runs on overlapping tiles.
+    With crop, FastSAM runs on every padded box at CROP_IMGSZ (segment_crops) instead of once on the full image.
+    Returns a list of instances (mask, box, class id and confidence).
+    """
+    img = frames.frame
+    with profiler.span("yolo"):
+        if tiling is None:
+            boxes, confidences, class_ids = detect(yolo_model, frames.share(), conf=conf)
+        else:
+            boxes, confidences, class_ids = detect_tiled(yolo_model, frames.share(), conf=conf, **tiling)
+    profiler.count("detections", len(boxes))
+
+    for box, confidence, class_id in zip(boxes, confidences, class_ids):
+        x1, y1, x2, y2 = box
+        print(f"YOLO detected class ID: {class_id} with confidence {confidence:.2f} at [{x1},{y1},{x2},{y2}]")
+
+    with profiler.span("validate_boxes"):
+        padded, kept = validate_boxes(boxes, img.shape, padding=padding)
+    with profiler.span("fastsam", boxes=len(padded), crop=crop):
+        if not padded:
+            masks = []
+        elif crop:
+            masks = segment_crops(sam_model, frames.share(), padded)
+        else:
+            masks = segment_detections(sam_model, frames.share(), padded, img.shape)
+
+    instances = []
+    for i, box, mask in zip(kept, padded, masks):
+        if mask is None:
+            print(f"SAM did not generate masks for detection {i}")
             continue
+        instances.append({
+            "mask": mask,
+            "box": box,
+            "class_id": int(class_ids[i]),
+            "confidence": float(confidences[i]),
+        })
+
+    profiler.count("instances", len(instances))
+    return instances
+
+
+def blend_instances(img, instances, alpha=ALPHA):
+    """
+    Draw every instance mask onto one overlay and blend it with the image.
+    """
+    overlay = np.zeros_like(img, dtype=np.uint8)
+    for instance in instances:
+        overlay[instance["mask"]] = class_colour(instance["class_id"])
+
+    return cv2.addWeighted(img, 1, overlay, alpha, 0)
+
+
+def label_map(instances, img_shape):
+    """
+    Raw class label map of the instances (0 - background, class id + 1 - lobster), saved losslessly for evaluation.
+    """
+    labels = np.zeros(img_shape[:2], dtype=np.uint8)
+    for instance in instances:
+        labels[instance["mask"]] = instance["class_id"] + 1
+    return labels
+
+
+if __name__ == "__main__":
+    # load the yolo model first
+    yolo_weights = "models/yolo12n_egg_noegg.pt"
+    sam_weights = "models/FastSAM-s.pt"
+    yolo_model = YOLO(yolo_weights)
+    sam_model = FastSAM(sam_weights)
+
+    # only process images that are new or changed since the last run with the same models, conf, padding and tiling
+    incremental = True
+
+    # the 4K+ tray photos are detected on overlapping 640 tiles, None feeds the whole image to YOLO
+    tiling = None  # {"tile_size": 640, "overlap": 128, "batch_size": 8}
+
+    # segment each box on its own crop at CROP_IMGSZ instead of running FastSAM on the full image
+    crop = False
+
+    # "images" writes a label map png and a blended overlay jpg per image, what metrics.py and label_eval.py read;
+    # "masks" appends the encoded instance masks to one file per run instead (mask_store.py renders both on request)
+    output_mode = "images"
+
+    input_dir = r'C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\evaluation_seg\segGT\segGT\images'
+    output_dir = "runs/fastsam"
+    os.makedirs(output_dir, exist_ok=True)
+
+    # raw class label maps (png), scored directly against the polygon labels by evaluation_seg/label_eval.py
+    label_map_dir = "runs/fastsam_labels"
+    os.makedirs(label_map_dir, exist_ok=True)
+
+    mask_path = os.path.join(output_dir, "fastsam.masks.jsonl")
+    mask_writer = MaskWriter(mask_path) if output_mode == "masks" else None
+
+    # extract class name from yolo
+    class_names = yolo_model.model.names
+
+    # every image is decoded once (by the prefetch threads) and shared between yolo, sam and the blending
+    frames = FrameBuffer()
+
+    def process(image_path, img):
+        filename = os.path.basename(image_path)
+        frames.put(img, image_path)
+
+        try:
+            with profiler.span("segment_image", image=filename):
+                instances = segment_image(yolo_model, sam_model, frames, conf=CONF, padding=PADDING, tiling=tiling, crop=crop)
+        except Exception as e:
+            print(f"Error processing {filename}: {e}")
+            profiler.count("failed_images")
+            return None
+
+        if mask_writer:
+            # an image without lobsters still gets its (empty) record, it is a prediction too
+            with profiler.span("write_masks"):
+                mask_writer.write(filename, img.shape, instances)
+            return []
+
+        # an empty label map is still a prediction (no lobsters), so it is always written
+        label_map_path = os.path.join(label_map_dir, os.path.splitext(filename)[0] + ".png")
+        outputs = [(label_map_path, label_map(instances, img.shape))]
+
+        if not instances:
+            print(f"No lobsters segmented in {filename}")
+            return outputs
+
+        # save the blended image, all instances go on the same overlay
+        mask_output_path = os.path.join(output_dir, f"segmented_{filename}")
+        print(f"Processed {filename} ({len(instances)} instances), saving segmentation overlay: {mask_output_path}")
+        with profiler.span("blend"):
+            outputs.append((mask_output_path, blend_instances(img, instances)))
+        return outputs
+
+    image_paths = list_images(input_dir)
+    manifest = None
+    if incremental:
+        params = {"conf": CONF, "padding": PADDING, "tiling": tiling, "crop": CROP_IMGSZ if crop else None, "output": output_mode}
+        if mask_writer:
+            manifest = InferenceManifest(output_dir, [yolo_weights, sam_weights], params, required_outputs=lambda image_path: [mask_path])
+        else:
+            # the label map is written for every image, the overlay only when something was segmented
+            manifest = InferenceManifest(label_map_dir, [yolo_weights, sam_weights], params,
+                                         required_outputs=lambda image_path: [
+                                             os.path.join(label_map_dir, os.path.splitext(os.path.basename(image_path))[0] + ".png")])
+        image_paths = manifest.pending(image_paths)
+
+    executor = StreamingExecutor(queue_depth=8, decode_workers=2, write_workers=2)
+    try:
+        executor.run(image_paths, process, done=manifest.add if manifest else None)
+    finally:
+        if manifest:
+            manifest.close()
+        if mask_writer:
+            mask_writer.close()
+
+    frames.report()
+    profiler.export("sam2seg")
@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import cv2
+import numpy as np
+
+from sam2seg import CONF, PADDING, validate_boxes, segment_detections, segment_crops
+from mask_store import encode_mask
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from profiling import profiler
+
+'''Local inference service, so the models are loaded and warmed up once instead of on every script run. YOLO and FastSAM
+stay in memory; the HTTP handler threads only decode the uploaded image and queue it. One batcher thread gathers the queued
+requests into a batch until it is full (MAX_BATCH) or the oldest request has waited MAX_LATENCY_MS, runs YOLO once on the
+whole batch and FastSAM per image (box prompts are per image), and hands every request its own result.
+
+    POST /segment?conf=0.7&crop=0&masks=rle    body: the encoded image (jpg/png)
+    GET  /health                               models, requests and batches served
+
+The response has the boxes, the masks in the mask_store.py encoding (tight box, "rle" or "bits", base64; masks=none skips
+them) and the timing of the request in ms: decode, queue (waiting for the batch), yolo (of the whole batch), fastsam,
+encode and total, plus the batch size. Everything runs on localhost and works on CPU, segment_file is a small client.'''
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_BATCH = 8
+MAX_LATENCY_MS = 20
+IMGSZ = 640
+
+def load_models(yolo_path, sam_path, device="cpu", warmup=True, imgsz=IMGSZ):
+    """
+    Load YOLO and FastSAM once and run a blank frame through both, so the first request does not pay the warm-up.
+    """
+    from ultralytics import FastSAM, YOLO
+
+    yolo_model = YOLO(yolo_path)
+    sam_model = FastSAM(sam_path)
+    yolo_model.to(device)
+    sam_model.to(device)
+
+    if warmup:
+        start = time.perf_counter()
+        blank = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        yolo_model([blank], verbose=False)
+        sam_model(blank, bboxes=[[0, 0, imgsz // 2, imgsz // 2]], verbose=False)
+        print(f"Models warmed up in {time.perf_counter() - start:.2f}s")
+    return yolo_model, sam_model
+
+class Request:
+    """
+    One queued image and the slot the batcher puts its result in.
+    """
+
+    def __init__(self, frame, conf=CONF, crop=False, masks="rle"):
+        self.frame = frame
+        self.conf = conf
+        self.crop = crop
+        self.masks = masks
+        self.queued = time.perf_counter()
+        self.timing = {}
+        self.result = None
+        self.error = None
+        # set when the client gave up waiting, the batcher then drops the request instead of running it
+        self.cancelled = False
+        self.finished = threading.Event()
+
+class DynamicBatcher:
+    """
+    Gathers queued requests into batches of up to max_batch, waiting at most max_latency_ms after the first request of a
+    batch arrived, and runs them through the warm models on one thread.
+    """
+
+    def __init__(self, yolo_model, sam_model, max_batch=MAX_BATCH, max_latency_ms=MAX_LATENCY_MS, padding=PADDING, imgsz=IMGSZ):
+        self.yolo_model = yolo_model
+        self.sam_model = sam_model
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.padding = padding
+        self.imgsz = imgsz
+        self.queue = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "failed": 0, "cancelled": 0}
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, request, timeout=None):
+        """
+        Queue a request and wait for its result. Raises the error of the batch if it failed.
+        """
+        self.queue.put(request)
+        if not request.finished.wait(timeout):
+            request.cancelled = True
+            raise TimeoutError("No result from the inference batch in time")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _next(self, timeout=None):
+        """
+        Next request that was not cancelled. Raises queue.Empty if none came within the timeout (0 - do not wait).
+        """
+        while True:
+            if timeout is None:
+                request = self.queue.get()
+            elif timeout > 0:
+                request = self.queue.get(timeout=timeout)
+            else:
+                request = self.queue.get_nowait()
+            if request is None or not request.cancelled:
+                return request
+            self.stats["cancelled"] += 1
+
+    def _gather(self):
+        first = self._next()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.queued + self.max_latency
+        while len(batch) < self.max_batch:
+            # past the deadline we still take what already queued up during the last batch, just without waiting
+            remaining = max(deadline - time.perf_counter(), 0)
+            try:
+                request = self._next(remaining)
+            except queue.Empty:
+                break
+            if request is None:  # stop after this batch
+                self.queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._gather()
+            if batch is None:
+                return
+            try:
+                self._run(batch)
+            except Exception as e:
+                print(f"Error in inference batch of {len(batch)}: {e}")
+                self.stats["failed"] += len(batch)
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                request.finished.set()
+
+    def _run(self, batch):
+        start = time.perf_counter()
+        for request in batch:
+            request.timing["queue"] = (start - request.queued) * 1000
+            request.timing["batch_size"] = len(batch)
+
+        # one YOLO call for the batch at the lowest conf asked for, every request then keeps its own threshold
+        with profiler.span("server_yolo", batch=len(batch)):
+            results = list(self.yolo_model([r.frame for r in batch], conf=min(r.conf for r in batch), imgsz=self.imgsz,
+                                           stream=True, verbose=False))
+        yolo_ms = (time.perf_counter() - start) * 1000
+
+        for request, result in zip(batch, results):
+            request.timing["yolo"] = yolo_ms
+            boxes = result.boxes.xyxy.cpu().numpy().astype(int).reshape(-1, 4)
+            confidences = result.boxes.conf.cpu().numpy().astype(np.float32)
+            class_ids = result.boxes.cls.cpu().numpy().astype(int)
+            keep = confidences >= request.conf
+            request.result = self._segment(request, boxes[keep], confidences[keep], class_ids[keep])
+
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+
+    def _segment(self, request, boxes, confidences, class_ids):
+        img = request.frame
+        start = time.perf_counter()
+        padded, kept = validate_boxes(boxes, img.shape, padding=self.padding)
+        with profiler.span("server_fastsam", boxes=len(padded), crop=request.crop):
+            if not padded:
+                masks = []
+            elif request.crop:
+                masks = segment_crops(self.sam_model, img, padded)
+            else:
+                masks = segment_detections(self.sam_model, img, padded, img.shape)
+        encode_start = time.perf_counter()
+        request.timing["fastsam"] = (encode_start - start) * 1000
+
+        instances = []
+        for i, box, mask in zip(kept, padded, masks):
+            if mask is None:
+                continue
+            instance = {"box": [int(v) for v in box], "class_id": int(class_ids[i]), "confidence": float(confidences[i])}
+            if request.masks != "none":
+                instance.update(encode_mask(mask, request.masks))
+            instances.append(instance)
+        request.timing["encode"] = (time.perf_counter() - encode_start) * 1000
+        return instances
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    # set by make_server
+    batcher = None
+    timeout = 60
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        self._send_json(200, {"status": "ok", "max_batch": self.batcher.max_batch,
+                              "max_latency_ms": self.batcher.max_latency * 1000, **self.batcher.stats})
+
+    def do_POST(self):
+        received = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path != "/segment":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        params = parse_qs(url.query)
+        try:
+            conf = float(params.get("conf", [CONF])[0])
+            crop = params.get("crop", ["0"])[0] in ("1", "true")
+            masks = params.get("masks", ["rle"])[0]
+            if masks not in ("rle", "bits", "none"):
+                raise ValueError(f"Unknown mask encoding {masks}, use 'rle', 'bits' or 'none'")
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+            if length <= 0:
+                raise ValueError
+        except ValueError:
+            self._send_json(400, {"error": "The request needs a positive numeric Content-Length with the image as the body"})
+            return
+
+        data = self.rfile.read(length)
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            self._send_json(400, {"error": "Could not decode the image in the request body"})
+            return
+        decode_ms = (time.perf_counter() - received) * 1000
+
+        request = Request(frame, conf=conf, crop=crop, masks=masks)
+        try:
+            instances = self.batcher.submit(request, timeout=self.timeout)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+
+        timing = {"decode": decode_ms, **request.timing, "total": (time.perf_counter() - received) * 1000}
+        self._send_json(200, {"height": frame.shape[0], "width": frame.shape[1], "instances": instances,
+                              "timing": {k: round(v, 2) if k != "batch_size" else v for k, v in timing.items()}})
+
+    def log_message(self, format, *args):
+        pass  # the timing in the response replaces the access log
+
+def make_server(batcher, host=HOST, port=PORT):
+    """
+    HTTP server whose handler threads feed the batcher. Use port 0 for a free port (server.server_address has it).
+    """
+    handler = type("Handler", (InferenceHandler,), {"batcher": batcher})
+    return ThreadingHTTPServer((host, port), handler)
+
+def serve(yolo_path, sam_path, host=HOST, port=PORT, device="cpu", max_batch=MAX_BATCH, max_latency_ms=MAX_LATENCY_MS):
+    yolo_model, sam_model = load_models(yolo_path, sam_path, device=device)
+    batcher = DynamicBatcher(yolo_model, sam_model, max_batch=max_batch, max_latency_ms=max_latency_ms)
+    server = make_server(batcher, host, port)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]} "
+          f"(batches of up to {max_batch}, {max_latency_ms} ms latency budget)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+        profiler.export("server")
+
+def segment_file(image_path, url=f"http://{HOST}:{PORT}", conf=CONF, crop=False, masks="rle"):
+    """
+    Client: send an image file to a running server and return its JSON response.
+    """
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    request = urllib.request.Request(f"{url}/segment?conf={conf}&crop={int(crop)}&masks={masks}", data=data,
+                                     headers={"Content-Type": "application/octet-stream"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+if __name__ == "__main__":
+    serve("models/yolo12n_egg_noegg.pt", "models/FastSAM-s.pt")
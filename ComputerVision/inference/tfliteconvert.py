@@ -1,7 +1,13 @@
+import os
+
 from ultralytics import FastSAM
 
+from calibration import ensure_calibration, export_int8_tflite
+
 # Load the YOLO11 model
 model = FastSAM("FastSAM-s.pt")
 
 model.export(format="tflite")
 
+# full-integer export calibrated on lobster images (calibration.py) instead of the generic onnx2tf sample
+export_int8_tflite(model, ensure_calibration(os.path.join("..", "data.yaml")))
@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+
+'''Tiled (sliced) detection for the high-resolution tray photos. yolo12n_egg_noegg.pt was trained at imgsz=640, so on a 4K+
+image the small lobsters shrink to a few pixels when the whole image is fed at once. Instead the image is cut into
+overlapping tile_size tiles that YOLO sees at full resolution, the tiles (of one or several images) go through the model
+in batches, the tile boxes are shifted back to image coordinates and the duplicates along the seams are merged with a
+class-aware NMS. A box cut off at an inner tile edge has a low IoU with the full box of the same lobster from the
+neighbouring tile or the whole-image pass, so such a piece is also merged when it lies mostly inside another box of its
+class (intersection over the smaller box); boxes away from the seams only go through the plain IoU NMS. An extra
+whole-image pass (full_image=True) keeps the lobsters that are larger than the overlap and get cut in half by the tiles.'''
+
+TILE_SIZE = 640
+OVERLAP = 128
+TILE_BATCH = 8
+NMS_IOU = 0.5
+# a box touching an inner tile edge with this much of its area inside another box of its class is a piece of it
+NMS_IOS = 0.8
+# pixels from a tile edge at which a box counts as cut off by it
+EDGE_MARGIN = 2
+
+def tile_origins(length, tile_size=TILE_SIZE, overlap=OVERLAP):
+    """
+    Start offsets along one axis with a stride of tile_size - overlap. The last tile is moved back to end at the edge
+    instead of hanging over it.
+    """
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    if stride <= 0:
+        raise ValueError(f"Overlap {overlap} must be smaller than the tile size {tile_size}")
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+def make_tiles(img, tile_size=TILE_SIZE, overlap=OVERLAP):
+    """
+    (x0, y0) origins and the crops (views, nothing is copied) of the tiles covering the image.
+    """
+    height, width = img.shape[:2]
+    origins = [(x0, y0) for y0 in tile_origins(height, tile_size, overlap) for x0 in tile_origins(width, tile_size, overlap)]
+    return origins, [img[y0:y0 + tile_size, x0:x0 + tile_size] for x0, y0 in origins]
+
+def nms(boxes, scores, class_ids, iou_threshold=NMS_IOU, ios_threshold=NMS_IOS, cut=None):
+    """
+    Class-aware non-maximum suppression for tiled detections. A box is suppressed by a higher scored box of its class
+    when their IoU is above iou_threshold. cut flags the boxes touching an inner tile edge (seam_cut): when the smaller
+    box of a pair is cut and the intersection covers more than ios_threshold of it, it is a piece of the other box and
+    is merged too, the kept box growing to cover it (a piece that outscores the full box must not crop the lobster).
+    Returns the indices of the kept boxes (highest score first) and their merged boxes.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int), np.zeros((0, 4), dtype=np.float32)
+    cut = np.zeros(len(boxes), dtype=bool) if cut is None else np.asarray(cut, dtype=bool)
+
+    # offsetting every class by more than the image size keeps boxes of different classes from suppressing each other
+    offset = class_ids[:, None].astype(np.float64) * (boxes.max() + 1)
+    b = boxes.astype(np.float64) + offset
+    areas = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+    order = np.argsort(-scores, kind="stable")
+    keep, merged = [], []
+    while len(order):
+        i = order[0]
+        rest = order[1:]
+        w = np.clip(np.minimum(b[i, 2], b[rest, 2]) - np.maximum(b[i, 0], b[rest, 0]), 0, None)
+        h = np.clip(np.minimum(b[i, 3], b[rest, 3]) - np.maximum(b[i, 1], b[rest, 1]), 0, None)
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        smaller_cut = np.where(areas[i] <= areas[rest], cut[i], cut[rest])
+        pieces = rest[(ios > ios_threshold) & smaller_cut]
+
+        box = boxes[i].astype(np.float32)
+        if len(pieces):
+            box = np.concatenate([np.minimum(box[:2], boxes[pieces, :2].min(axis=0)),
+                                  np.maximum(box[2:], boxes[pieces, 2:].max(axis=0))])
+        keep.append(i)
+        merged.append(box)
+        order = rest[(iou <= iou_threshold) & ~np.isin(rest, pieces)]
+    return np.array(keep, dtype=int), np.array(merged, dtype=np.float32)
+
+def seam_cut(boxes, x0, y0, tile_width, tile_height, width, height, margin=EDGE_MARGIN):
+    """
+    Which tile boxes (tile coordinates) touch an edge of the tile that lies inside the image, i.e. may be cut off.
+    """
+    return (((boxes[:, 0] <= margin) & (x0 > 0)) | ((boxes[:, 1] <= margin) & (y0 > 0))
+            | ((boxes[:, 2] >= tile_width - margin) & (x0 + tile_width < width))
+            | ((boxes[:, 3] >= tile_height - margin) & (y0 + tile_height < height)))
+
+def result_arrays(result):
+    boxes = result.boxes
+    if not boxes or len(boxes.xyxy) == 0:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=int)
+    return (boxes.xyxy.cpu().numpy().astype(np.float32),
+            boxes.conf.cpu().numpy().astype(np.float32),
+            boxes.cls.cpu().numpy().astype(int))
+
+def detect_tiled_batch(yolo_model, frames, conf=0.7, tile_size=TILE_SIZE, overlap=OVERLAP, batch_size=TILE_BATCH,
+                       iou_threshold=NMS_IOU, full_image=True, ios_threshold=NMS_IOS):
+    """
+    Tiled detection over a list of frames. The tiles of all frames are pooled and run through YOLO batch_size at a time.
+    Returns one (boxes int xyxy, confidences, class ids) tuple per frame, like sam2seg.detect.
+    """
+    jobs = []  # (frame index, x0, y0, crop)
+    for f, img in enumerate(frames):
+        origins, crops = make_tiles(img, tile_size, overlap)
+        jobs.extend((f, x0, y0, crop) for (x0, y0), crop in zip(origins, crops))
+
+    found = [([], [], [], []) for _ in frames]  # boxes, confidences, class ids, cut at a seam
+    for start in range(0, len(jobs), batch_size):
+        batch = jobs[start:start + batch_size]
+        results = yolo_model([crop for _, _, _, crop in batch], conf=conf, imgsz=tile_size, verbose=False)
+        for (f, x0, y0, crop), result in zip(batch, results):
+            boxes, confidences, class_ids = result_arrays(result)
+            height, width = frames[f].shape[:2]
+            found[f][3].append(seam_cut(boxes, x0, y0, crop.shape[1], crop.shape[0], width, height))
+            found[f][0].append(boxes + np.array([x0, y0, x0, y0], dtype=np.float32))
+            found[f][1].append(confidences)
+            found[f][2].append(class_ids)
+
+    if full_image:
+        # a frame that fits in one tile was already seen whole
+        large = [f for f, img in enumerate(frames) if max(img.shape[:2]) > tile_size]
+        for start in range(0, len(large), batch_size):
+            indices = large[start:start + batch_size]
+            results = yolo_model([frames[f] for f in indices], conf=conf, imgsz=tile_size, verbose=False)
+            for f, result in zip(indices, results):
+                values = result_arrays(result)
+                for part, value in zip(found[f], values + (np.zeros(len(values[0]), dtype=bool),)):
+                    part.append(value)
+
+    detections = []
+    for boxes, confidences, class_ids, cut in found:
+        boxes, confidences, class_ids, cut = (np.concatenate(boxes), np.concatenate(confidences),
+                                              np.concatenate(class_ids), np.concatenate(cut))
+        keep, merged = nms(boxes, confidences, class_ids, iou_threshold, ios_threshold, cut)
+        detections.append((np.round(merged).astype(int), confidences[keep], class_ids[keep]))
+    return detections
+
+def detect_tiled(yolo_model, source, conf=0.7, tile_size=TILE_SIZE, overlap=OVERLAP, batch_size=TILE_BATCH,
+                 iou_threshold=NMS_IOU, full_image=True, ios_threshold=NMS_IOS):
+    """
+    Tiled detection of one frame, a drop-in for sam2seg.detect.
+    """
+    return detect_tiled_batch(yolo_model, [source], conf, tile_size, overlap, batch_size, iou_threshold, full_image,
+                              ios_threshold)[0]
+
+def draw_boxes(img, boxes, confidences, class_ids, names):
+    """
+    Annotated copy of the image with the merged boxes, for runinference.py (the tiled boxes have no Results.plot).
+    """
+    annotated = img.copy()
+    thickness = max(2, round(sum(img.shape[:2]) / 1000))
+    for (x1, y1, x2, y2), confidence, class_id in zip(boxes, confidences, class_ids):
+        colour = (255, 0, 0) if class_id == 0 else (0, 0, 255)
+        cv2.rectangle(annotated, (int(x1), int(y1)), (int(x2), int(y2)), colour, thickness)
+        cv2.putText(annotated, f"{names[int(class_id)]} {confidence:.2f}", (int(x1), max(int(y1) - 5, 15)),
+                    cv2.FONT_HERSHEY_SIMPLEX, thickness / 3, colour, thickness)
+    return annotated
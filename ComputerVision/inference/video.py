@@ -0,0 +1,224 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from executor import list_images
+from frames import FrameBuffer
+from sam2seg import CONF, PADDING, detect, validate_boxes, segment_detections, segment_crops, blend_instances
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from box_ops import box_iou
+
+'''Video / frame-sequence mode of sam2seg.py for the recorded inspection footage. YOLO still runs on every frame, but the
+boxes are linked across frames by a greedy IoU tracker and FastSAM only runs for the tracks that are new or whose box
+moved or changed size by more than a threshold since their mask was computed. The other tracks reuse that mask, warped
+(scaled and shifted) from the box it was computed for onto the current box, so the segmentation cost follows the changes
+in the scene rather than the frame count.'''
+
+TRACK_IOU = 0.3
+MAX_MISSED = 5
+# rerun FastSAM when the box centre moved more than this fraction of the box size, or its width/height changed by more
+MOVE_THRESHOLD = 0.1
+RESIZE_THRESHOLD = 0.15
+
+class Track:
+    def __init__(self, track_id, box, class_id, confidence):
+        self.id = track_id
+        self.box = box
+        self.class_id = class_id
+        self.confidence = confidence
+        self.missed = 0
+        # the last FastSAM mask and the box it was computed for
+        self.mask = None
+        self.mask_box = None
+
+class IoUTracker:
+    """
+    Greedy same-class IoU matching of the detections of a frame to the live tracks. Tracks that are not matched for
+    more than max_missed frames are dropped.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU, max_missed=MAX_MISSED):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []
+        self.next_id = 0
+
+    def update(self, boxes, confidences, class_ids):
+        """
+        Returns the tracks of the current detections, in detection order.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        matched = [None] * len(boxes)
+
+        if self.tracks and len(boxes):
+            track_boxes = np.array([t.box for t in self.tracks], dtype=np.float32)
+            track_cls = np.array([t.class_id for t in self.tracks])
+            iou = box_iou(track_boxes, boxes) * (track_cls[:, None] == np.asarray(class_ids)[None, :])
+            while True:
+                t, d = np.unravel_index(np.argmax(iou), iou.shape)
+                if iou[t, d] < self.iou_threshold:
+                    break
+                matched[d] = self.tracks[t]
+                iou[t, :] = 0
+                iou[:, d] = 0
+
+        current = []
+        for d, track in enumerate(matched):
+            if track is None:
+                track = Track(self.next_id, None, None, None)
+                self.next_id += 1
+                self.tracks.append(track)
+            track.box = [int(v) for v in boxes[d]]
+            track.class_id = int(class_ids[d])
+            track.confidence = float(confidences[d])
+            track.missed = 0
+            current.append(track)
+
+        live = {id(t) for t in current}
+        for track in self.tracks:
+            if id(track) not in live:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return current
+
+def needs_segmentation(track, move_threshold=MOVE_THRESHOLD, resize_threshold=RESIZE_THRESHOLD):
+    """
+    True if the track has no mask yet or its box moved or resized too much since the mask was computed.
+    """
+    if track.mask is None:
+        return True
+    (x1, y1, x2, y2), (mx1, my1, mx2, my2) = track.box, track.mask_box
+    w, h, mw, mh = x2 - x1, y2 - y1, mx2 - mx1, my2 - my1
+    shift = max(abs((x1 + x2) - (mx1 + mx2)) / 2 / max(mw, 1), abs((y1 + y2) - (my1 + my2)) / 2 / max(mh, 1))
+    resize = max(abs(w - mw) / max(mw, 1), abs(h - mh) / max(mh, 1))
+    return shift > move_threshold or resize > resize_threshold
+
+def warp_mask(mask, from_box, to_box):
+    """
+    Move a full-frame mask from the box it was computed for onto a new box (scale and shift only).
+    """
+    (fx1, fy1, fx2, fy2), (tx1, ty1, tx2, ty2) = from_box, to_box
+    sx, sy = (tx2 - tx1) / max(fx2 - fx1, 1), (ty2 - ty1) / max(fy2 - fy1, 1)
+    affine = np.float32([[sx, 0, tx1 - fx1 * sx], [0, sy, ty1 - fy1 * sy]])
+    height, width = mask.shape
+    return cv2.warpAffine(mask.astype(np.uint8), affine, (width, height), flags=cv2.INTER_NEAREST).astype(bool)
+
+def read_frames(source):
+    """
+    Frames of a video file (or camera index) or of a folder of frame images, one at a time.
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        for path in list_images(source):
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"Warning: Could not read frame {path}")
+                continue
+            yield frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+def segment_frame(yolo_model, sam_model, frames, tracker, conf=CONF, padding=PADDING, crop=False):
+    """
+    Detect, track and segment one frame. Returns the instances (with their track id), how many boxes went to FastSAM and
+    how many masks were reused.
+    """
+    img = frames.frame
+    boxes, confidences, class_ids = detect(yolo_model, frames.share(), conf=conf)
+    padded, kept = validate_boxes(boxes, img.shape, padding=padding)
+    tracks = tracker.update(padded, confidences[kept], class_ids[kept])
+
+    stale = [t for t in tracks if needs_segmentation(t)]
+    if stale:
+        stale_boxes = [t.box for t in stale]
+        if crop:
+            masks = segment_crops(sam_model, frames.share(), stale_boxes)
+        else:
+            masks = segment_detections(sam_model, frames.share(), stale_boxes, img.shape)
+        for track, mask in zip(stale, masks):
+            # no new mask: keep the last one (warped below) rather than dropping the object from the overlay
+            if mask is not None:
+                track.mask, track.mask_box = mask, list(track.box)
+
+    instances, reused = [], 0
+    for track in tracks:
+        if track.mask is None:
+            continue
+        reused += track.mask_box != track.box or track not in stale
+        mask = track.mask if track.mask_box == track.box else warp_mask(track.mask, track.mask_box, track.box)
+        instances.append({"mask": mask, "box": track.box, "class_id": track.class_id,
+                          "confidence": track.confidence, "track_id": track.id})
+    return instances, len(stale), reused
+
+def video_fps(source, default=25):
+    if isinstance(source, str) and os.path.isdir(source):
+        return default
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    return fps or default
+
+def draw_track_ids(img, instances):
+    for instance in instances:
+        x1, y1 = instance["box"][:2]
+        cv2.putText(img, f"#{instance['track_id']}", (x1, max(y1 - 5, 15)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+    return img
+
+def process_video(yolo_model, sam_model, source, output_path, fps=None, conf=CONF, padding=PADDING, crop=False):
+    """
+    Segment a video (or frame folder) and write the blended overlay video. Returns the counts of the run.
+    """
+    tracker = IoUTracker()
+    frames = FrameBuffer()
+    writer = None
+    counts = {"frames": 0, "instances": 0, "segmented": 0, "reused": 0}
+
+    fps = fps or video_fps(source)
+
+    try:
+        for frame in read_frames(source):
+            frames.put(frame)
+            instances, segmented, reused = segment_frame(yolo_model, sam_model, frames, tracker, conf, padding, crop)
+            counts["frames"] += 1
+            counts["instances"] += len(instances)
+            counts["segmented"] += segmented
+            counts["reused"] += reused
+
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            writer.write(draw_track_ids(blend_instances(frame, instances), instances))
+
+            if counts["frames"] % 100 == 0:
+                print(f"{counts['frames']} frames, {counts['segmented']} boxes segmented, {counts['reused']} masks reused")
+    finally:
+        if writer is not None:
+            writer.release()
+
+    print(f"Processed {counts['frames']} frames: {counts['instances']} instances, {counts['segmented']} boxes sent to FastSAM, "
+          f"{counts['reused']} masks reused from earlier frames")
+    return counts
+
+if __name__ == "__main__":
+    from ultralytics import FastSAM, YOLO
+
+    yolo_model = YOLO("models/yolo12n_egg_noegg.pt")
+    sam_model = FastSAM("models/FastSAM-s.pt")
+
+    video_path = r'C:\Users\dorot\Desktop\Dissertation2025\ModelDevelopment\Pipeline\inference\videos\inspection.mp4'
+    output_dir = "runs/fastsam_video"
+    os.makedirs(output_dir, exist_ok=True)
+
+    output_path = os.path.join(output_dir, "segmented_" + os.path.splitext(os.path.basename(video_path))[0] + ".mp4")
+    process_video(yolo_model, sam_model, video_path, output_path)
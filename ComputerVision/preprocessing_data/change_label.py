@@ -1,29 +1,180 @@
 import os
+import json
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-dataset_path = "lobster_data"
-annotations_path = os.path.join(dataset_path, "labels")
-for split in ["train", "val", "test"]:
-    split_annotations_path = os.path.join(annotations_path, split)
-    
-    # Get all .txt annotation files in the split directory
-    annotation_files = [f for f in os.listdir(split_annotations_path) if f.lower().endswith(".txt")]
-    
-    print(f"Processing {split} split - found {len(annotation_files)} annotations")
-    
-    # Modify the labels in each annotation file
-    for annotation_file in annotation_files:
+# old class id -> new class id, None drops the polygons of that class
+CLASS_MAPPING = {1: 0}
+
+MANIFEST_NAME = ".remap_manifest.jsonl"
+
+def remap_lines(lines, mapping):
+    """
+    Apply the class mapping to the label lines. Lines whose class is not remapped are kept byte for byte, and so are
+    malformed lines (class id not an integer), which are reported instead of aborting the run.
+    Returns the new lines, the class counts before and after and the numbers of the malformed lines.
+    """
+    before, after = Counter(), Counter()
+    new_lines, bad = [], []
+
+    for number, line in enumerate(lines, 1):
+        parts = line.split()
+        if not parts:
+            new_lines.append(line)
+            continue
+
+        try:
+            class_id = int(parts[0])
+        except ValueError:
+            bad.append(number)
+            new_lines.append(line)
+            continue
+        before[class_id] += 1
+        if class_id not in mapping:
+            after[class_id] += 1
+            new_lines.append(line)
+            continue
+
+        new_id = mapping[class_id]
+        if new_id is None:
+            continue
+        after[new_id] += 1
+        parts[0] = str(new_id)
+        new_lines.append(' '.join(parts) + '\n')
+
+    return new_lines, before, after, bad
+
+def load_manifest(manifest_path, mapping):
+    """
+    Files already processed with this mapping (name -> sha1, mtime, size and class counts of the current content).
+    A manifest written for another mapping does not count.
+    """
+    done = {}
+    if not os.path.exists(manifest_path):
+        return done
+
+    with open(manifest_path, 'r') as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("mapping") != {str(k): v for k, v in mapping.items()}:
+            return None
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:  # last line cut off by a crash
+                continue
+            done[entry["file"]] = entry
+    return done
+
+def remap_file(annotation_path, mapping, done):
+    """
+    Remap one label file. Returns (status, counts before, counts after, (journal entry, new content or None)).
+    Files whose mtime and size match their journal entry are skipped without being read.
+    """
+    stat = os.stat(annotation_path)
+    name = os.path.basename(annotation_path)
+    entry = done.get(name)
+    if entry and entry.get("mtime_ns") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+        counts = Counter({int(k): v for k, v in entry["counts"].items()})
+        return "done", counts, counts, None
+
+    with open(annotation_path, 'rb') as file:
+        content = file.read()
+
+    if entry and entry["sha1"] == hashlib.sha1(content).hexdigest():
+        # already remapped by a previous run, remapping again would apply the mapping twice
+        counts = Counter({int(k): v for k, v in entry["counts"].items()})
+        return "done", counts, counts, None
+
+    lines = content.decode().splitlines(keepends=True)
+    new_lines, before, after, bad = remap_lines(lines, mapping)
+    if bad:
+        print(f"Warning: {name} has malformed lines {bad}, kept as they are")
+    new_content = ''.join(new_lines).encode()
+
+    entry = {"file": name, "sha1": hashlib.sha1(new_content).hexdigest(), "counts": {str(k): v for k, v in after.items()}}
+    if new_content == content:
+        # journaled too, so the next run skips the file on its mtime and size
+        entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        return "unchanged", before, after, (entry, None)
+    return "remapped", before, after, (entry, new_content)
+
+def write_temp(annotation_path, new_content):
+    """
+    Write the new content next to the label file; renaming it over the original means a crash never leaves a half-written
+    file. Returns the temp path.
+    """
+    tmp_path = annotation_path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(new_content)
+        file.flush()
+        os.fsync(file.fileno())
+    return tmp_path
+
+def remap_split(split_annotations_path, mapping, workers=8):
+    """
+    Remap every label file of a split in parallel. Returns the class counts before and after the run.
+    """
+    annotation_files = sorted(f for f in os.listdir(split_annotations_path) if f.lower().endswith(".txt"))
+    print(f"Processing {split_annotations_path} - found {len(annotation_files)} annotations")
+
+    manifest_path = os.path.join(split_annotations_path, MANIFEST_NAME)
+    done = load_manifest(manifest_path, mapping)
+    if done is None:
+        print("Mapping changed since the last run, starting a new manifest")
+        done = {}
+    if not done:
+        with open(manifest_path, 'w') as f:
+            f.write(json.dumps({"mapping": {str(k): v for k, v in mapping.items()}}) + '\n')
+
+    manifest_lock = threading.Lock()
+    manifest = open(manifest_path, 'a')
+
+    def process(annotation_file):
         annotation_path = os.path.join(split_annotations_path, annotation_file)
-        
-        # Open and read the annotation file
-        with open(annotation_path, 'r') as file:
-            lines = file.readlines()
-        
-        # Modify the label from 1 to 0
-        with open(annotation_path, 'w') as file:
-            for line in lines:
-                parts = line.split()
-                if parts and parts[0] == '1':  
-                    parts[0] = '0' 
-                file.write(' '.join(parts) + '\n')  
-
-print("Label modification completed!")
\ No newline at end of file
+        try:
+            status, before, after, pending = remap_file(annotation_path, mapping, done)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Warning: Could not remap {annotation_file}: {e}")
+            return "failed", Counter(), Counter()
+
+        if pending:
+            entry, new_content = pending
+            tmp_path = None
+            if new_content is not None:
+                # the rename keeps the mtime of the temp file, so it can go in the entry already
+                tmp_path = write_temp(annotation_path, new_content)
+                tmp_stat = os.stat(tmp_path)
+                entry.update(mtime_ns=tmp_stat.st_mtime_ns, size=tmp_stat.st_size)
+            # the manifest entry goes in before the rename, so a re-run recognises the file as done even after a crash
+            with manifest_lock:
+                manifest.write(json.dumps(entry) + '\n')
+                manifest.flush()
+            if tmp_path:
+                os.replace(tmp_path, annotation_path)
+        return status, before, after
+
+    statuses, before_total, after_total = Counter(), Counter(), Counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for status, before, after in pool.map(process, annotation_files):
+                statuses[status] += 1
+                before_total.update(before)
+                after_total.update(after)
+    finally:
+        manifest.close()
+
+    print(f"  remapped {statuses['remapped']}, unchanged {statuses['unchanged']}, already done {statuses['done']}, "
+          f"failed {statuses['failed']}")
+    for class_id in sorted(before_total.keys() | after_total.keys()):
+        print(f"  class {class_id}: {before_total[class_id]} -> {after_total[class_id]} polygons")
+    return before_total, after_total
+
+if __name__ == "__main__":
+    dataset_path = "lobster_data"
+    annotations_path = os.path.join(dataset_path, "labels")
+    for split in ["train", "val", "test"]:
+        remap_split(os.path.join(annotations_path, split), CLASS_MAPPING)
+
+    print("Label modification completed!")
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import numpy as np
+
+'''Compiles the YOLO-seg .txt labels of a folder (class_id x1 y1 x2 y2 ... normalised) into one compact store so tools can load
+the polygons of any image without parsing the text files again:
+
+    coords.<gen>.npy         float32 (P, 2)  all polygon points, one polygon after another
+    poly_offsets.<gen>.npy   int64 (N + 1)   polygon i is coords[poly_offsets[i]:poly_offsets[i + 1]]
+    poly_classes.<gen>.npy   int32 (N)       class id of every polygon
+    image_offsets.<gen>.npy  int64 (M + 1)   image j owns polygons image_offsets[j]:image_offsets[j + 1]
+    index.json               the generation, and the stems of the M images with the mtime and size of their label file
+
+The arrays are memory-mapped on load. Rebuilding only re-parses the label files whose mtime or size changed. Every build
+writes its arrays under a new generation and only then swaps in index.json, so the index always names a complete set of
+arrays; a crash mid-build leaves the old store readable.'''
+
+CACHE_DIRNAME = ".label_cache"
+ARRAYS = ("coords", "poly_offsets", "poly_classes", "image_offsets")
+
+def parse_label_file(label_path):
+    """
+    Parse a YOLO-seg label file into (class ids, list of (N, 2) float32 polygons). Lines with fewer than 3 points are skipped,
+    and so are malformed lines (non-numeric values), which are reported instead of failing the whole build.
+    """
+    classes, polygons, bad = [], [], []
+    with open(label_path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            try:
+                values = np.array(line.split(), dtype=np.float32)
+            except ValueError:
+                bad.append(number)
+                continue
+            if len(values) < 7:
+                continue
+            classes.append(int(values[0]))
+            polygons.append(values[1:1 + 2 * ((len(values) - 1) // 2)].reshape(-1, 2))
+    if bad:
+        print(f"Warning: {label_path} has malformed lines {bad}, skipped")
+    return classes, polygons
+
+def scan_labels(label_folder):
+    """
+    Stem -> (path, mtime_ns, size) of every .txt file in the folder, from a single directory scan.
+    """
+    labels = {}
+    with os.scandir(label_folder) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(".txt"):
+                stat = entry.stat()
+                labels[os.path.splitext(entry.name)[0]] = (entry.path, stat.st_mtime_ns, stat.st_size)
+    return labels
+
+def remove_stale_generations(cache_dir, generation):
+    """
+    Delete the arrays of older (or crashed) builds. Files still mapped by another process stay until the next build.
+    """
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npy") and name.split(".")[0] in ARRAYS and name.split(".")[1] != generation:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+class LabelCache:
+    """
+    Read-only, memory-mapped view of a compiled label store, keyed by image stem.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, "index.json"), 'r') as f:
+            index = json.load(f)
+
+        self.generation = index["generation"]
+        self.label_folder = index["label_folder"]
+        self.files = index["files"]
+        self.stems = [entry["stem"] for entry in self.files]
+        self.positions = {stem: j for j, stem in enumerate(self.stems)}
+
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(cache_dir, f"{name}.{self.generation}.npy"), mmap_mode='r'))
+
+        if (len(self.image_offsets) != len(self.stems) + 1 or len(self.poly_offsets) != len(self.poly_classes) + 1
+                or self.poly_offsets[-1] != len(self.coords) or self.image_offsets[-1] != len(self.poly_classes)):
+            raise ValueError(f"Label cache {cache_dir} is inconsistent, rebuild it with LabelCache.build")
+
+    def __contains__(self, stem):
+        return stem in self.positions
+
+    def __len__(self):
+        return len(self.stems)
+
+    def classes(self, stem):
+        """
+        Class ids of the polygons of one image (empty if the image has no label file).
+        """
+        if stem not in self.positions:
+            return np.zeros(0, dtype=np.int32)
+        j = self.positions[stem]
+        return np.asarray(self.poly_classes[self.image_offsets[j]:self.image_offsets[j + 1]])
+
+    def polygons(self, stem):
+        """
+        List of (class_id, (N, 2) normalised points) of one image, same as read_yolo_polygons on its label file.
+        """
+        if stem not in self.positions:
+            return []
+        j = self.positions[stem]
+        polygons = []
+        for i in range(self.image_offsets[j], self.image_offsets[j + 1]):
+            points = np.asarray(self.coords[self.poly_offsets[i]:self.poly_offsets[i + 1]])
+            polygons.append((int(self.poly_classes[i]), points))
+        return polygons
+
+    @classmethod
+    def build(cls, label_folder, cache_dir=None):
+        """
+        Compile (or incrementally update) the label store of a folder and return it. Files whose mtime and size match the
+        existing store are copied over without being parsed.
+        """
+        cache_dir = cache_dir or os.path.join(label_folder, CACHE_DIRNAME)
+        labels = scan_labels(label_folder)
+
+        previous = None
+        if os.path.exists(os.path.join(cache_dir, "index.json")):
+            try:
+                previous = cls(cache_dir)
+            except (ValueError, OSError, KeyError) as e:
+                print(f"Rebuilding label cache from scratch: {e}")
+
+        coords, poly_offsets, poly_classes, image_offsets, files = [], [0], [], [0], []
+        parsed = reused = 0
+
+        for stem in sorted(labels):
+            path, mtime_ns, size = labels[stem]
+            j = previous.positions.get(stem) if previous else None
+
+            if j is not None and previous.files[j]["mtime_ns"] == mtime_ns and previous.files[j]["size"] == size:
+                # copies, so nothing keeps the old memory maps open once they are dropped
+                classes = previous.classes(stem).tolist()
+                points = [np.array(p) for _, p in previous.polygons(stem)]
+                reused += 1
+            else:
+                classes, points = parse_label_file(path)
+                parsed += 1
+
+            for p in points:
+                coords.append(p)
+                poly_offsets.append(poly_offsets[-1] + len(p))
+            poly_classes.extend(classes)
+            image_offsets.append(len(poly_classes))
+            files.append({"stem": stem, "mtime_ns": mtime_ns, "size": size})
+
+        arrays = {
+            "coords": np.concatenate(coords).astype(np.float32) if coords else np.zeros((0, 2), dtype=np.float32),
+            "poly_offsets": np.array(poly_offsets, dtype=np.int64),
+            "poly_classes": np.array(poly_classes, dtype=np.int32),
+            "image_offsets": np.array(image_offsets, dtype=np.int64),
+        }
+        # drop the memory maps before overwriting the files (Windows cannot replace a mapped file)
+        previous = None
+
+        # the arrays of a new generation first, then one rename of the index switches readers over to them
+        generation = f"{time.time_ns():x}"
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(cache_dir, f"{name}.{generation}.npy"), array)
+
+        tmp_path = os.path.join(cache_dir, "index.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"generation": generation, "label_folder": os.path.abspath(label_folder), "files": files}, f)
+        os.replace(tmp_path, os.path.join(cache_dir, "index.json"))
+        remove_stale_generations(cache_dir, generation)
+
+        print(f"Label cache {cache_dir}: {len(files)} label files, {parsed} parsed, {reused} reused")
+        return cls(cache_dir)
+
+def open_label_cache(label_folder, cache_dir=None):
+    """
+    The label store of a folder, rebuilt first if any label file was added, removed or changed since it was compiled.
+    """
+    cache_dir = cache_dir or os.path.join(label_folder, CACHE_DIRNAME)
+    try:
+        cache = LabelCache(cache_dir)
+    except (ValueError, OSError, KeyError):
+        return LabelCache.build(label_folder, cache_dir)
+
+    labels = scan_labels(label_folder)
+    current = {entry["stem"]: (entry["mtime_ns"], entry["size"]) for entry in cache.files}
+    if current != {stem: (mtime_ns, size) for stem, (_, mtime_ns, size) in labels.items()}:
+        del cache
+        return LabelCache.build(label_folder, cache_dir)
+    return cache
+
+if __name__ == "__main__":
+    dataset_path = "lobster_data"
+    annotations_path = os.path.join(dataset_path, "labels")
+
+    for split in ["train", "val", "test"]:
+        LabelCache.build(os.path.join(annotations_path, split))
@@ -0,0 +1,146 @@
+import os
+import json
+import errno
+import random
+import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from label_cache import open_label_cache
+
+'''Single-pass split planner, it replaced the old split_images.py + split_labels.py that moved the files in place. The images
+and labels are read once, every image is stratified by the classes present in its label (egg-bearing, undefined, both or
+none), the plan is written to a split manifest and the train/val/test trees are built out of hardlinks (or symlinks), so
+the original files are never moved or copied.'''
+
+SPLITS = ["train", "val", "test"]
+# the old split_images.py used 0.8/0.2/0.1, which adds up to 1.1 and left the test split empty
+SPLIT_RATIOS = {"train": 0.7, "val": 0.2, "test": 0.1}
+SEED = 42
+
+MANIFEST_NAME = "split_manifest.json"
+
+def scan_images(images_path, extensions=(".jpg", ".jpeg", ".png")):
+    """
+    Stem -> file name of every image in the folder, from a single directory scan.
+    """
+    with os.scandir(images_path) as entries:
+        return {os.path.splitext(e.name)[0]: e.name for e in entries
+                if e.is_file() and e.name.lower().endswith(extensions)}
+
+def plan_split(stems, strata, ratios=SPLIT_RATIOS, seed=SEED):
+    """
+    Assign every stem to a split. Each stratum is shuffled and cut by the ratios on its own, so every split gets the
+    same mix of class combinations. Returns stem -> split.
+    """
+    if abs(sum(ratios.values()) - 1.0) > 1e-6:
+        raise ValueError(f"Split ratios must add up to 1, got {ratios}")
+
+    groups = defaultdict(list)
+    for stem in sorted(stems):
+        groups[strata[stem]].append(stem)
+
+    rng = random.Random(seed)
+    plan = {}
+    for key in sorted(groups):
+        group = groups[key]
+        rng.shuffle(group)
+
+        n_train = round(len(group) * ratios["train"])
+        n_val = round(len(group) * ratios["val"])
+        for i, stem in enumerate(group):
+            plan[stem] = "train" if i < n_train else "val" if i < n_train + n_val else "test"
+    return plan
+
+def link_file(src, dst, mode="hardlink"):
+    """
+    Link src to dst, leaving the original untouched. Hardlinks fall back to symlinks across devices or on file systems
+    that do not allow them; any other error (e.g. a missing src) is raised rather than leaving a dangling link.
+    """
+    if os.path.lexists(dst):
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM):
+                raise
+    elif not os.path.exists(src):
+        raise FileNotFoundError(errno.ENOENT, "Cannot link a missing file", src)
+    os.symlink(os.path.abspath(src), dst)
+
+def check_separate(dataset_path, output_path):
+    """
+    Refuse an output tree that is, contains or lies inside the dataset: the split directories are cleared before linking,
+    which would delete the source images and labels.
+    """
+    dataset, output = os.path.realpath(dataset_path), os.path.realpath(output_path)
+    if os.path.splitdrive(dataset)[0].lower() != os.path.splitdrive(output)[0].lower():
+        return  # different drives on Windows, commonpath cannot compare them
+    if os.path.commonpath([dataset, output]) in (dataset, output):
+        raise ValueError(f"The output path {output_path} overlaps the dataset {dataset_path}, choose a separate folder")
+
+def split_dataset(dataset_path, output_path, ratios=SPLIT_RATIOS, seed=SEED, link_mode="hardlink", workers=16):
+    """
+    Plan the split of dataset_path/images + dataset_path/labels, write the manifest and build the
+    output_path/{images,labels}/{train,val,test} trees out of links.
+    """
+    check_separate(dataset_path, output_path)
+    images_path = os.path.join(dataset_path, "images")
+    labels_path = os.path.join(dataset_path, "labels")
+
+    images = scan_images(images_path)
+    labels = open_label_cache(labels_path)
+    print(f"Found {len(images)} images, {sum(stem in labels for stem in images)} with labels")
+
+    # class presence of every image, e.g. (0,) egg-bearing only, (0, 1) both, () no label
+    strata = {stem: tuple(sorted(set(labels.classes(stem).tolist()))) for stem in images}
+    plan = plan_split(images, strata, ratios, seed)
+
+    os.makedirs(output_path, exist_ok=True)
+    manifest = {
+        "dataset": os.path.abspath(dataset_path),
+        "ratios": ratios,
+        "seed": seed,
+        "splits": {stem: {"split": plan[stem], "image": images[stem], "classes": list(strata[stem])} for stem in sorted(plan)},
+    }
+    with open(os.path.join(output_path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+    # clear the old trees so images that moved to another split do not stay behind in the previous one
+    for kind in ["images", "labels"]:
+        for split in SPLITS:
+            split_dir = os.path.join(output_path, kind, split)
+            shutil.rmtree(split_dir, ignore_errors=True)
+            os.makedirs(split_dir)
+
+    links = []
+    for stem, split in plan.items():
+        links.append((os.path.join(images_path, images[stem]), os.path.join(output_path, "images", split, images[stem])))
+        if stem in labels:
+            links.append((os.path.join(labels_path, stem + ".txt"), os.path.join(output_path, "labels", split, stem + ".txt")))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda link: link_file(*link, mode=link_mode), links))
+
+    for split in SPLITS:
+        stems = [stem for stem in plan if plan[stem] == split]
+        counts = defaultdict(int)
+        for stem in stems:
+            counts[strata[stem]] += 1
+        summary = ", ".join(f"{list(key) or 'none'}: {n}" for key, n in sorted(counts.items()))
+        print(f"{split}: {len(stems)} images ({summary})")
+
+    return plan
+
+if __name__ == "__main__":
+    dataset_path = "lobster_data"
+    output_path = "lobster_data_split"
+
+    split_dataset(dataset_path, output_path)
+
+    print(" Task achieved.")
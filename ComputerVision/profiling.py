@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+
+'''Lightweight spans and counters for the inference and evaluation scripts (sam2seg.py, runinference.py,
+evaluation_seg/metrics.py). Profiling is off unless AQUASEG_PROFILE=1 is set (or profiler.enable() is called); when it is
+off, span() hands back one shared no-op context manager and count() returns straight away, so the hooks can stay in the
+hot paths. The recorded events are exported as JSONL, as a Chrome trace (chrome://tracing or https://ui.perfetto.dev) and,
+optionally, as TensorBoard scalars next to the training runs in evaluation_seg/YOLO11-seg/yolov11seg_runs.'''
+
+TENSORBOARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "evaluation_seg", "YOLO11-seg", "yolov11seg_runs")
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.profiler.events.append({
+            "type": "span",
+            "name": self.name,
+            "start_us": (self.start - self.profiler.origin) / 1000,
+            "dur_us": (end - self.start) / 1000,
+            "tid": threading.get_ident(),
+            "args": self.args,
+        })
+        return False
+
+class Profiler:
+    """
+    Collects timing spans and counters. Events from several threads (the executor decode/write pools) are appended to one
+    list, which is safe under the GIL; counters go through a lock.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self.counters = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def span(self, name, **args):
+        """
+        Context manager timing the block it wraps, e.g. with profiler.span("yolo", image=name): ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def count(self, name, value=1):
+        """
+        Add value to a running counter; every change is kept as an event so the trace shows the counter over time.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] += value
+            total = self.counters[name]
+        self.events.append({"type": "counter", "name": name, "start_us": (time.perf_counter_ns() - self.origin) / 1000,
+                            "value": total, "tid": threading.get_ident()})
+
+    def summary(self):
+        """
+        Count, total and mean ms of every span name, plus the final counter values.
+        """
+        spans = defaultdict(list)
+        for event in self.events:
+            if event["type"] == "span":
+                spans[event["name"]].append(event["dur_us"] / 1000)
+        return {
+            "spans": {name: {"count": len(d), "total_ms": sum(d), "mean_ms": sum(d) / len(d)} for name, d in spans.items()},
+            "counters": dict(self.counters),
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"{'span':<24}{'count':>8}{'total ms':>12}{'mean ms':>10}")
+        for name, s in sorted(summary["spans"].items(), key=lambda item: -item[1]["total_ms"]):
+            print(f"{name:<24}{s['count']:>8}{s['total_ms']:>12.1f}{s['mean_ms']:>10.2f}")
+        for name, value in sorted(summary["counters"].items()):
+            print(f"{name:<24}{value:>8g}")
+
+    def export_jsonl(self, path):
+        with open(path, 'w') as f:
+            for event in self.events:
+                f.write(json.dumps(event) + '\n')
+
+    def export_chrome_trace(self, path):
+        """
+        Trace-event format: spans as complete ("X") events, counters as "C" events.
+        """
+        pid = os.getpid()
+        trace = []
+        for event in self.events:
+            if event["type"] == "span":
+                trace.append({"name": event["name"], "ph": "X", "ts": event["start_us"], "dur": event["dur_us"],
+                              "pid": pid, "tid": event["tid"], "args": event["args"]})
+            else:
+                trace.append({"name": event["name"], "ph": "C", "ts": event["start_us"], "pid": pid,
+                              "args": {event["name"]: event["value"]}})
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+    def export_tensorboard(self, log_dir):
+        """
+        Span durations (one step per occurrence) and counters as TensorBoard scalars under profile/.
+        """
+        try:
+            from torch.utils.tensorboard import SummaryWriter
+        except ImportError:
+            print("TensorBoard export skipped: torch.utils.tensorboard is not available")
+            return
+
+        writer = SummaryWriter(log_dir)
+        steps = defaultdict(int)
+        for event in self.events:
+            if event["type"] == "span":
+                writer.add_scalar(f"profile/{event['name']}_ms", event["dur_us"] / 1000, steps[event["name"]])
+            else:
+                writer.add_scalar(f"profile/{event['name']}", event["value"], steps[event["name"]])
+            steps[event["name"]] += 1
+        writer.close()
+
+    def export(self, name, output_dir="profiles", tensorboard=False):
+        """
+        Write <output_dir>/<name>.jsonl and <name>.trace.json (and the TensorBoard scalars) if profiling was on.
+        """
+        if not self.enabled:
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        self.export_jsonl(os.path.join(output_dir, f"{name}.jsonl"))
+        self.export_chrome_trace(os.path.join(output_dir, f"{name}.trace.json"))
+        if tensorboard or os.environ.get("AQUASEG_PROFILE_TENSORBOARD") == "1":
+            self.export_tensorboard(os.path.join(TENSORBOARD_DIR, f"profile_{name}_{time.strftime('%Y%m%d-%H%M%S')}"))
+        self.print_summary()
+        print(f"Profile saved to {output_dir}/{name}.jsonl and {name}.trace.json")
+
+# one profiler per process, shared by every module that imports it
+profiler = Profiler(enabled=os.environ.get("AQUASEG_PROFILE") == "1")
@@ -1,5 +1,10 @@
 from ultralytics import YOLO
 
+from shard_cache import build_shard_cache, install_shard_loader
+
+# decode every image once into the shared shard cache, both training runs read from it
+install_shard_loader(build_shard_cache("data.yaml", imgsz=640))
+
 # Load the YOLO model
 model = YOLO("yolo11n.pt")
 
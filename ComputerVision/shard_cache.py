@@ -0,0 +1,209 @@
+import os
+import glob
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import yaml
+
+'''Decode-once image cache for the CPU training runs (runscript.py, runscript2.py, evaluation_seg/YOLO11-seg/train-yolo.py).
+Every image of every split in data.yaml is decoded and resized once (long side = imgsz, the same resize the Ultralytics
+dataset does in load_image) and stored top-left in a fixed imgsz x imgsz slot, padded with 114, of a memory-mapped uint8 shard:
+
+    <cache_dir>/<split>_<k>.npy   uint8 (n, imgsz, imgsz, 3)
+    <cache_dir>/index.json        image path -> shard, slot, original and resized size, mtime and size of the image file
+
+install_shard_loader then makes the training dataset read its images from the shards instead of decoding the JPEGs again
+every epoch. All runs on the same data.yaml and imgsz share one cache.'''
+
+SHARD_SIZE = 1024
+PAD_VALUE = 114
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+def image_key(path):
+    """
+    Normalised path used to look images up in the index (the dataset may list them relative or with other separators).
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+def split_images(data_yaml, split):
+    """
+    Sorted image paths of a split in data.yaml (a folder, a .txt list of images, or a list of either).
+    """
+    with open(data_yaml, 'r') as f:
+        data = yaml.safe_load(f)
+
+    root = data.get("path") or os.path.dirname(os.path.abspath(data_yaml))
+    sources = data.get(split)
+    if not sources:
+        return []
+
+    images = []
+    for source in sources if isinstance(sources, list) else [sources]:
+        source = source if os.path.isabs(source) else os.path.join(root, source)
+        if os.path.isdir(source):
+            images.extend(p for p in glob.glob(os.path.join(source, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+        elif source.endswith(".txt") and os.path.exists(source):
+            with open(source, 'r') as f:
+                lines = [line.strip() for line in f if line.strip()]
+            images.extend(p if os.path.isabs(p) else os.path.join(os.path.dirname(source), p) for p in lines)
+        else:
+            print(f"Warning: {split} source {source} not found")
+    return sorted(images)
+
+def resize_long_side(im, imgsz, augment=True):
+    """
+    Resize so the long side is imgsz, the same as the Ultralytics dataset load_image (linear when training, area when
+    shrinking validation images).
+    """
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        interp = cv2.INTER_LINEAR if (augment or r > 1) else cv2.INTER_AREA
+        w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+        im = cv2.resize(im, (w, h), interpolation=interp)
+    return im
+
+def write_index(index, index_path):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+def default_cache_dir(data_yaml, imgsz):
+    return os.path.join(os.path.dirname(os.path.abspath(data_yaml)), ".shard_cache", f"imgsz{imgsz}")
+
+def build_shard_cache(data_yaml, cache_dir=None, imgsz=640, splits=("train", "val", "test"), shard_size=SHARD_SIZE, workers=8):
+    """
+    Decode and resize every image of the splits once into memory-mapped shards. A split is only rebuilt when one of its
+    images was added, removed or changed (mtime or size). Returns the cache directory.
+    """
+    cache_dir = cache_dir or default_cache_dir(data_yaml, imgsz)
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, "index.json")
+
+    index = {"imgsz": imgsz, "splits": {}, "images": {}}
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            previous = json.load(f)
+        if previous.get("imgsz") == imgsz:
+            index = previous
+
+    for split in splits:
+        images = split_images(data_yaml, split)
+        stats = {image_key(p): [os.stat(p).st_mtime_ns, os.stat(p).st_size] for p in images}
+        cached = {k: v[6:] for k, v in index["images"].items() if v[0].startswith(f"{split}_")}
+
+        if cached == stats:
+            print(f"Shard cache {split}: {len(images)} images up to date")
+            continue
+
+        # drop the old entries and shards of the split before writing it again
+        index["images"] = {k: v for k, v in index["images"].items() if not v[0].startswith(f"{split}_")}
+        write_index(index, index_path)
+        for old in glob.glob(os.path.join(cache_dir, f"{split}_*.npy")):
+            os.remove(old)
+
+        augment = split == "train"
+
+        def decode(path):
+            im = cv2.imread(path)
+            if im is None:
+                return None
+            return im.shape[:2], resize_long_side(im, imgsz, augment)
+
+        names = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for start in range(0, len(images), shard_size):
+                batch = images[start:start + shard_size]
+                name = f"{split}_{start // shard_size:04d}"
+                shard = np.lib.format.open_memmap(os.path.join(cache_dir, f"{name}.npy"), mode='w+', dtype=np.uint8,
+                                                  shape=(len(batch), imgsz, imgsz, 3))
+                shard[:] = PAD_VALUE
+
+                for slot, (path, decoded) in enumerate(zip(batch, pool.map(decode, batch))):
+                    if decoded is None:
+                        # kept in the index (slot -1) so an unreadable image does not force a rebuild on every run
+                        print(f"Warning: Could not read image {path}")
+                        index["images"][image_key(path)] = [name, -1, 0, 0, 0, 0] + stats[image_key(path)]
+                        continue
+                    (h0, w0), im = decoded
+                    h, w = im.shape[:2]
+                    shard[slot, :h, :w] = im
+                    index["images"][image_key(path)] = [name, slot, h0, w0, h, w] + stats[image_key(path)]
+
+                shard.flush()
+                del shard
+                names.append(name)
+
+        index["splits"][split] = names
+        write_index(index, index_path)
+        print(f"Shard cache {split}: {len(images)} images in {len(names)} shards")
+
+    return cache_dir
+
+class ShardCache:
+    """
+    Read side of the cache: looks an image up and returns its resized frame from the memory-mapped shard.
+    """
+
+    def __init__(self, cache_dir):
+        with open(os.path.join(cache_dir, "index.json"), 'r') as f:
+            index = json.load(f)
+        self.cache_dir = cache_dir
+        self.imgsz = index["imgsz"]
+        self.images = index["images"]
+        self.shards = {}
+
+    def _shard(self, name):
+        # opened lazily, so each DataLoader worker maps the shards it actually reads
+        if name not in self.shards:
+            self.shards[name] = np.load(os.path.join(self.cache_dir, f"{name}.npy"), mmap_mode='r')
+        return self.shards[name]
+
+    def load(self, path):
+        """
+        (frame, (h0, w0)) of an image, or None if it is not cached. The frame is a writable copy, augmentations modify it.
+        """
+        entry = self.images.get(image_key(path))
+        if entry is None or entry[1] < 0:
+            return None
+        name, slot, h0, w0, h, w = entry[:6]
+        return np.array(self._shard(name)[slot, :h, :w]), (h0, w0)
+
+def install_shard_loader(cache_dir):
+    """
+    Make the Ultralytics datasets read images from the shard cache. Images that are not cached, or datasets with another
+    imgsz or a square (non-rect) resize, still go through the original loader. DataLoader workers inherit the hook when
+    they are forked (Linux, the cluster); spawned workers (Windows) fall back to decoding the JPEGs.
+    """
+    from ultralytics.data.base import BaseDataset
+
+    cache = ShardCache(cache_dir)
+    original_load_image = BaseDataset.load_image
+
+    def load_image(self, i, rect_mode=True):
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+        cached = cache.load(self.im_files[i]) if (rect_mode and self.imgsz == cache.imgsz) else None
+        if cached is None:
+            return original_load_image(self, i, rect_mode)
+
+        im, (h0, w0) = cached
+        # same buffering as the original loader, the mosaic augmentation picks its extra images from the buffer
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                if self.cache != "ram":
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+
+        return im, (h0, w0), im.shape[:2]
+
+    BaseDataset.load_image = load_image
+    print(f"Training images are read from the shard cache {cache_dir} ({len(cache.images)} images)")
+    return cache